@@ -0,0 +1,231 @@
+# Benchmarks the solvers of the other folders at a few problem sizes. Every case runs in a fresh process, so that its
+# wall time and peak memory are not affected by the cases before it. The results are written to a JSON file, and can
+# be compared against a baseline JSON file made by an earlier run, to flag the cases that got slower
+#
+#   python RunBenchmarks.py                          runs everything and writes bench_results.json
+#   python RunBenchmarks.py --save-baseline          also stores the results as the baseline
+#   python RunBenchmarks.py --quick --cases gambler  runs the smallest size of the gambler case only
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queues
+import resource
+import sys
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ["JacksCars", "GamblerProblem", "Miscellaneous", "CliffWalk", "MultiArmedBandit", "RaceTrackProblem"]:
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+
+# Every case takes a problem size and returns a dictionary with the number of iterations it took to converge (or
+# None), how much work was done, and the unit of that work
+
+# Policy iteration for Jack's Car Rental with ncar_states cars per location, until the policy is stable
+def jacks_policy_iteration(ncar_states):
+    import JacksCars as jc
+    from PoissonTables import build_tables
+    from VectorizedJacks import VectorizedJacks
+
+    # The tables are built every time, the disk cache would make the timings depend on earlier runs
+    max_morning = ncar_states + jc.max_moves
+    prob_1, rew_1 = build_tables(jc.lambda_1r, jc.lambda_1d, ncar_states, max_morning, jc.theta)
+    prob_2, rew_2 = build_tables(jc.lambda_2r, jc.lambda_2d, ncar_states, max_morning, jc.theta)
+
+    jacks = VectorizedJacks(prob_1, prob_2, rew_1, rew_2, jc.max_moves, jc.discount, jc.theta)
+    rounds = 0
+    while True:
+        rounds += 1
+        jacks.policy_eval()
+        if not jacks.update_policy_t():
+            break
+    return {"iterations": rounds, "work": jacks.sweeps, "unit": "sweeps"}
+
+
+# Value iteration for the Gambler's Problem with the given goal capital
+def gambler_value_iteration(goal):
+    from GamblersSolver import GamblersSolver
+
+    solver = GamblersSolver(goal, 0.4, theta=1e-9)
+    sweeps = solver.calculate_state_values()
+    return {"iterations": sweeps, "work": sweeps, "unit": "sweeps"}
+
+
+# Policy evaluation of the random policy on a side x side gridworld with two terminal corners
+def gridworld_policy_evaluation(side):
+    from StencilPolicyEvaluation import StencilPolicyEvaluation
+
+    evaluation = StencilPolicyEvaluation(side, side, [[0, 0], [side - 1, side - 1]], y=0.9)
+    sweeps, converged = evaluation.evaluate()
+    return {"iterations": sweeps if converged else None, "work": sweeps, "unit": "sweeps"}
+
+
+# Q-Learning on the default cliff walk, 200 episodes in each of the given number of lockstep environments
+def cliff_q_learning(environments):
+    from LockstepQLearning import LockstepQLearning
+    from QLearningCliff import Grid
+
+    lockstep = LockstepQLearning(Grid(12, 4), environments, seed=0)
+    returns, lengths = lockstep.run(200)
+    return {"iterations": None, "work": int(lengths.sum()), "unit": "steps"}
+
+
+# The 10-armed testbed, 1000 steps of the given number of runs
+def bandit_testbed(runs):
+    from BanditTestbed import BanditTestbed
+
+    testbed = BanditTestbed(runs, 10, seed=0)
+    testbed.run(1000, 0.1)
+    return {"iterations": None, "work": runs * 1000, "unit": "pulls"}
+
+
+# Off-policy Monte Carlo on the first default race track, for the given number of episodes
+def race_track_monte_carlo(episodes):
+    import random
+    import TrackUtils as tu
+
+    random.seed(0)
+    car = tu.Car(tu.Track.make_default_track(1))
+    car.off_policy_monte_carlo(episodes)
+    return {"iterations": None, "work": episodes + 1, "unit": "episodes"}
+
+
+# The cases, with their sizes. The first size of every case is the one used by --quick
+CASES = {
+    "jacks": (jacks_policy_iteration, [11, 21, 41]),
+    "gambler": (gambler_value_iteration, [100, 1000, 4000]),
+    "gridworld": (gridworld_policy_evaluation, [100, 500, 1000]),
+    "cliff": (cliff_q_learning, [100, 500]),
+    "bandit": (bandit_testbed, [500, 2000]),
+    "racetrack": (race_track_monte_carlo, [1000, 5000]),
+}
+
+
+# Runs one case in the current process and puts its measurements in the queue. If the case raises, the traceback is
+# put in the queue instead, as the error of the case
+def run_case(name, size, queue):
+    start = time.perf_counter()
+    try:
+        result = CASES[name][0](size)
+    except Exception:
+        queue.put({"case": name, "size": size, "error": traceback.format_exc()})
+        return
+    wall_time = time.perf_counter() - start
+    result.update({
+        "case": name,
+        "size": size,
+        "wall_time": wall_time,
+        "rate": result["work"] / wall_time,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+    queue.put(result)
+
+
+# Runs one case in a fresh process and returns its measurements. A case that raises, whose process dies, or that takes
+# more than timeout seconds is returned as a result with an error instead
+def measure(name, size, timeout=None):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(name, size, queue))
+    process.start()
+    start = time.perf_counter()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except queues.Empty:
+            if not process.is_alive():
+                # The result can still be on its way when the process has just ended
+                try:
+                    result = queue.get(timeout=1)
+                except queues.Empty:
+                    result = {"case": name, "size": size,
+                              "error": "the process died with exit code {}".format(process.exitcode)}
+            elif timeout is not None and time.perf_counter() - start > timeout:
+                process.terminate()
+                result = {"case": name, "size": size, "error": "timed out after {} seconds".format(timeout)}
+    process.join()
+    return result
+
+
+# Compares the results against the baseline. Returns the results whose wall time or peak memory grew by more than
+# the tolerance, as a list of (result, baseline result) pairs
+def find_regressions(results, baseline, tolerance):
+    previous = {(r["case"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["case"], result["size"]))
+        if old is None or "error" in result or "error" in old:
+            continue
+        if result["wall_time"] > old["wall_time"] * (1 + tolerance) or \
+                result["peak_memory_mb"] > old["peak_memory_mb"] * (1 + tolerance):
+            regressions += [(result, old)]
+    return regressions
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmarks the solvers at a few problem sizes")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=sorted(CASES))
+    parser.add_argument("--quick", action="store_true", help="only run the smallest size of every case")
+    parser.add_argument("--output", default=os.path.join(here, "bench_results.json"))
+    parser.add_argument("--baseline", default=os.path.join(here, "bench_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown (or memory growth) that is flagged, 0.25 is 25%%")
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds after which a case is stopped as failed")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.cases:
+        for size in CASES[name][1][:1] if args.quick else CASES[name][1]:
+            result = measure(name, size, args.timeout)
+            results += [result]
+            if "error" in result:
+                print("{0:10} {1:>6}: FAILED, {2}".format(name, size, result["error"].strip().splitlines()[-1]))
+                continue
+            print("{0:10} {1:>6}: {2:8.3f} s, {3:7.1f} MB, {4:12.1f} {5}/s, iterations {6}".format(
+                name, size, result["wall_time"], result["peak_memory_mb"], result["rate"], result["unit"],
+                result["iterations"]))
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("\nResults written to {}".format(args.output))
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for result, old in regressions:
+            print("REGRESSION {0} {1}: {2:.3f} s (baseline {3:.3f} s), {4:.1f} MB (baseline {5:.1f} MB)".format(
+                result["case"], result["size"], result["wall_time"], old["wall_time"], result["peak_memory_mb"],
+                old["peak_memory_mb"]))
+        if not regressions:
+            print("No regressions against {}".format(args.baseline))
+    else:
+        print("No baseline found at {}".format(args.baseline))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Baseline saved to {}".format(args.baseline))
+
+    failures = [result for result in results if "error" in result]
+    if failures:
+        print("{} cases failed: {}".format(len(failures), ", ".join(
+            "{} {}".format(result["case"], result["size"]) for result in failures)))
+    return 1 if regressions or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
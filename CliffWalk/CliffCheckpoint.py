@@ -0,0 +1,94 @@
+# Checkpoints of a QLearningCliff.Agent, see Miscellaneous/CheckpointFolder.py. The files hold states of
+# State.states_dictionary as arrays of x, y and the values of the actions in State.DIRECTIONS, NaN for the actions
+# that lead off the grid. A base file has all the states, a delta file only the ones in State.touched
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from QLearningCliff import Agent, Grid, State
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Miscellaneous"))
+from CheckpointFolder import CheckpointFolder
+
+
+# The states with the given (x, y) keys as arrays
+def state_arrays(keys):
+    keys = sorted(keys)
+    values = np.full((len(keys), len(State.DIRECTIONS)), np.nan)
+    for row, key in enumerate(keys):
+        actions = State.states_dictionary[key].action_dictionary
+        values[row] = [actions.get(d, np.nan) for d in State.DIRECTIONS]
+    xy = np.array(keys, dtype=np.int32).reshape(-1, 2)
+    return {"x": xy[:, 0], "y": xy[:, 1], "values": values}
+
+
+class CliffCheckpoint(CheckpointFolder):
+
+    def base_arrays(self, agent):
+        return dict(width=len(agent.grid.grid[0]), height=len(agent.grid.grid),
+                    **state_arrays(State.states_dictionary))
+
+    def delta_arrays(self, agent):
+        return state_arrays(State.touched)
+
+    def check(self, agent, data):
+        size = (int(data["width"]), int(data["height"]))
+        if size != (len(agent.grid.grid[0]), len(agent.grid.grid)):
+            raise ValueError("The checkpoint in {} is of a {}x{} grid".format(self.directory, *size))
+
+    def apply(self, agent, data, base):
+        if base:
+            State.states_dictionary.clear()
+        for x, y, values in zip(data["x"].tolist(), data["y"].tolist(), data["values"].tolist()):
+            actions = State.get_state((x, y)).action_dictionary
+            for d, value in zip(State.DIRECTIONS, values):
+                if d in actions:
+                    actions[d] = value
+
+    def clear_touched(self, agent):
+        State.touched.clear()
+
+    def run_episode(self, agent):
+        agent.generate_episode()
+
+
+# Runs Q-Learning episodes with the agent until episodes episodes are done, saving a checkpoint in directory every
+# every episodes. If the folder already has a checkpoint, the run carries on from it. Returns the checkpoint
+def train(agent, episodes, directory, every=1000, compact_every=20):
+    checkpoint = CliffCheckpoint(directory, compact_every)
+    checkpoint.train(agent, episodes, every)
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learns the cliff walk with Q-Learning, with checkpoints, and "
+                                                 "carries on from the last one if there is one. A checkpoint that "
+                                                 "already has all the episodes is used as it is")
+    parser.add_argument("--width", type=int, default=12)
+    parser.add_argument("--height", type=int, default=4)
+    parser.add_argument("--episodes", type=int, default=5000)
+    parser.add_argument("--every", type=int, default=1000, help="episodes between checkpoints")
+    parser.add_argument("--compact-every", type=int, default=20, help="deltas between base files")
+    parser.add_argument("--directory", required=True)
+    parser.add_argument("--seed", type=int, default=None, help="only used when there is no checkpoint yet")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    agent = Agent(Grid(args.width, args.height))
+    start = time.time()
+    checkpoint = train(agent, args.episodes, args.directory, args.every, args.compact_every)
+    seconds = time.time() - start
+    print("Done in {0:.1f} seconds, {1:.3f} of them ({2:.2f}%) on checkpoints".format(
+        seconds, checkpoint.seconds, 100 * checkpoint.seconds / seconds))
+
+    # The final episode is printed to console, like Agent.generate_episodes() does
+    agent.epsilon = 0
+    agent.generate_episode(True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# The cliff walk compiled into integer tables. The state of the cell (x, y) has the id y * width + x, and for every
+# state and action (in the order of State.DIRECTIONS) the tables hold the next state, the reward, whether the goal is
+# reached and whether the action bootstraps from the next state. Falling in the cliff is already resolved in the
+# tables: the next state is the start, and like in QLearningCliff.Agent, where the cliff cells keep action values of 0,
+# it does not bootstrap
+# The action values are one flat array indexed by state * 4 + action, read and written through memoryviews, which
+# are much faster than NumPy for one value at a time
+import random
+
+import numpy as np
+
+from QLearningCliff import State
+
+
+class CliffEnv:
+
+    # The board of QLearningCliff.Grid, any size. The start is the bottom left corner, the goal the bottom right one,
+    # and the cells between them are the cliff
+    def __init__(self, width=12, height=4):
+        self.width = width
+        self.height = height
+        self.n_states = width * height
+        self.start = 0
+        self.goal = width - 1
+
+        cliff = np.zeros(self.n_states, dtype=bool)
+        cliff[1:width - 1] = True
+        state = np.arange(self.n_states)
+        x, y = state % width, state // width
+        directions = np.array(State.DIRECTIONS)
+        next_x = x[:, None] + directions[:, 0]
+        next_y = y[:, None] + directions[:, 1]
+        self.valid = (next_x >= 0) & (next_x < width) & (next_y >= 0) & (next_y < height)
+        target = np.where(self.valid, next_y * width + next_x, 0)
+        fell = self.valid & cliff[target]
+
+        # Every table is indexed by [state, action], the actions that would leave the grid have a next state of -1
+        self.next_state = np.where(self.valid, np.where(fell, self.start, target), -1).astype(np.int32)
+        self.rewards = np.where(fell, -100., -1.)
+        self.done = self.valid & (target == self.goal)
+        self.bootstrap = self.valid & ~fell & ~self.done
+
+        # The valid actions of every state first, to pick a random one with one random number
+        self.valid_count = self.valid.sum(axis=1).astype(np.int8)
+        self.valid_order = np.argsort(~self.valid, axis=1, kind="stable").astype(np.int8)
+
+    # The board of a QLearningCliff.Grid
+    @classmethod
+    def from_grid(cls, grid):
+        return cls(len(grid.grid[0]), len(grid.grid))
+
+    # Returns the id of the cell (x, y)
+    def state_id(self, x, y):
+        return y * self.width + x
+
+    # Returns the (x, y) of a state id
+    def position(self, state):
+        return state % self.width, state // self.width
+
+    # Returns the action values of a new agent as a flat array, the actions that would leave the grid have a value
+    # of -inf so they are never the greedy action
+    def new_action_values(self):
+        return np.where(self.valid, 0., -np.inf).ravel()
+
+
+# Q-Learning on a CliffEnv, the same updates as QLearningCliff.Agent. Besides the action values, the greedy action
+# and the largest action value of every state are kept up to date, so picking the greedy action and bootstrapping are
+# one read each
+class CompiledAgent:
+
+    def __init__(self, env, epsilon=0.05, alpha=0.9, gamma=0.9, seed=None):
+        self.env = env
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.gamma = gamma
+        self.rng = random.Random(seed)
+        self.Q = env.new_action_values()
+        self.V = np.zeros(env.n_states)
+        self.best_actions = self.Q.reshape(-1, 4).argmax(axis=1).astype(np.int8)
+        self.episodes = 0
+        self.steps = 0
+
+        self.q = memoryview(self.Q)
+        self.v = memoryview(self.V)
+        self.best = memoryview(self.best_actions)
+        self.next_state = memoryview(env.next_state.ravel())
+        self.rewards = memoryview(env.rewards.ravel())
+        self.done = memoryview(env.done.ravel())
+        self.bootstrap = memoryview(env.bootstrap.ravel())
+        self.valid_count = memoryview(env.valid_count)
+        self.valid_order = memoryview(env.valid_order.ravel())
+
+    # Makes the agent read and write the given action values, largest values and greedy actions instead of its own,
+    # arrays in shared memory for example
+    def use_arrays(self, Q, V, best_actions):
+        self.Q, self.V, self.best_actions = Q, V, best_actions
+        self.q, self.v, self.best = memoryview(Q), memoryview(V), memoryview(best_actions)
+
+    # Sets the value of an action, and updates the greedy action and the largest value of its state. Ties go to the
+    # first action in State.DIRECTIONS, like State.get_best_action()
+    def set_action_value(self, state, a, value):
+        q, b, best = self.q, 4 * state, self.best[state]
+        old = q[b + a]
+        q[b + a] = value
+        if a == best:
+            if value >= old:
+                self.v[state] = value
+            else:
+                values = (q[b], q[b + 1], q[b + 2], q[b + 3])
+                self.v[state] = max(values)
+                self.best[state] = values.index(self.v[state])
+        elif value > self.v[state] or (value == self.v[state] and a < best):
+            self.v[state] = value
+            self.best[state] = a
+
+    # Chooses an action using the epsilon-greedy soft policy
+    def epsilon_greedy_action(self, state):
+        if self.rng.random() >= self.epsilon:
+            return self.best[state]
+        return self.valid_order[4 * state + int(self.rng.random() * self.valid_count[state])]
+
+    # Generates an episode from the start to the goal, updating the action values on the go. Returns the return and
+    # the length of the episode, and the states visited if record is True
+    # The body of set_action_value() and epsilon_greedy_action() is inlined, this loop is where all the time goes
+    def generate_episode(self, record=False):
+        q, v, best, next_state, rewards = self.q, self.v, self.best, self.next_state, self.rewards
+        done, bootstrap, valid_count, valid_order = self.done, self.bootstrap, self.valid_count, self.valid_order
+        epsilon, alpha, gamma, random_number = self.epsilon, self.alpha, self.gamma, self.rng.random
+        state, total, length = self.env.start, 0., 0
+        visited = []
+        while True:
+            if record:
+                visited += [self.env.position(state)]
+            b = 4 * state
+            best_a = best[state]
+            if random_number() >= epsilon:
+                a = best_a
+            else:
+                a = valid_order[b + int(random_number() * valid_count[state])]
+
+            i = b + a
+            reward = rewards[i]
+            target = reward + gamma * v[next_state[i]] if bootstrap[i] else reward
+            old = q[i]
+            value = old + alpha * (target - old)
+            q[i] = value
+            if a == best_a:
+                if value >= old:
+                    v[state] = value
+                else:
+                    values = (q[b], q[b + 1], q[b + 2], q[b + 3])
+                    v[state] = max(values)
+                    best[state] = values.index(v[state])
+            elif value > v[state] or (value == v[state] and a < best_a):
+                v[state] = value
+                best[state] = a
+
+            total += reward
+            length += 1
+            if done[i]:
+                self.episodes += 1
+                self.steps += length
+                return (total, length, visited) if record else (total, length)
+            state = next_state[i]
+
+    # Generates x number of episodes, then prints the states of a greedy one
+    def generate_episodes(self, x):
+        for _ in range(x):
+            self.generate_episode()
+
+        temp = self.epsilon
+        self.epsilon = 0
+        print(self.generate_episode(True)[2])
+        self.epsilon = temp
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import time
+
+    from QLearningCliff import Agent, Grid
+
+    # Both agents learn from scratch for the same number of episodes
+    random.seed(0)
+    agent = Agent(Grid(12, 4))
+    start = time.time()
+    for _ in range(2000):
+        agent.generate_episode()
+    old_time = time.time() - start
+
+    compiled = CompiledAgent(CliffEnv(12, 4), seed=0)
+    start = time.time()
+    for _ in range(2000):
+        compiled.generate_episode()
+    new_time = time.time() - start
+    print("2000 episodes on the 12x4 board: {0:.4f} seconds with QLearningCliff.Agent, {1:.4f} seconds compiled, "
+          "{2:.1f} times faster".format(old_time, new_time, old_time / new_time))
+    compiled.generate_episodes(0)
+
+    start = time.time()
+    env = CliffEnv(1000, 1000)
+    compiled = CompiledAgent(env, seed=0)
+    tables = [env.next_state, env.rewards, env.done, env.bootstrap, env.valid, env.valid_count, env.valid_order,
+              compiled.Q, compiled.V, compiled.best_actions]
+    print("1000x1000 board compiled in {0:.2f} seconds, {1:.0f} MB of tables and action values".format(
+        time.time() - start, sum(table.nbytes for table in tables) / 2**20))
@@ -0,0 +1,142 @@
+# Dyna-Q and prioritized sweeping on a CompiledCliff.CliffEnv. Every real step is recorded in a model of the board,
+# kept in arrays indexed like the action values, and is followed by a number of planning updates on transitions
+# taken from the model instead of the environment, so far fewer real steps are needed when they are expensive
+#   "dyna"         the planning updates are on observed (state, action) pairs picked at random
+#   "prioritized"  the pairs wait in a max-heap keyed by the size of their TD error, and after a pair is updated its
+#                  predecessors (the pairs that lead to its state) are queued again if their error is above theta
+import heapq
+
+import numpy as np
+
+from CompiledCliff import CliffEnv, CompiledAgent
+
+MODES = ("dyna", "prioritized")
+
+
+class DynaAgent(CompiledAgent):
+
+    def __init__(self, env, planning_steps=10, mode="dyna", theta=1e-4, epsilon=0.05, alpha=0.9, gamma=0.9,
+                 seed=None):
+        if mode not in MODES:
+            raise ValueError("mode must be one of {}, not {}".format(", ".join(MODES), mode))
+        super().__init__(env, epsilon, alpha, gamma, seed)
+        self.planning_steps = planning_steps
+        self.mode = mode
+        self.theta = theta
+        self.real_steps = 0
+        self.planning_updates = 0
+
+        # The model, indexed by state * 4 + action. A next state of -1 means the pair was never tried
+        self.model_next_state = np.full(4 * env.n_states, -1, dtype=np.int32)
+        self.model_rewards = np.zeros(4 * env.n_states)
+        self.model_bootstrap = np.zeros(4 * env.n_states, dtype=bool)
+        self.model_next = memoryview(self.model_next_state)
+        self.model_reward = memoryview(self.model_rewards)
+        self.model_boot = memoryview(self.model_bootstrap)
+        self.observed = []
+        self.predecessors = {}
+        self.queue = []
+
+    # Takes a real step from the environment, and records it in the model. Returns the next state, the reward and
+    # whether the goal was reached
+    def real_step(self, i):
+        new_state, reward = self.next_state[i], self.rewards[i]
+        self.real_steps += 1
+        if self.model_next[i] < 0:
+            self.model_next[i] = new_state
+            self.model_reward[i] = reward
+            self.model_boot[i] = self.bootstrap[i]
+            self.observed += [i]
+            self.predecessors.setdefault(new_state, []).append(i)
+        return new_state, reward, self.done[i]
+
+    # The TD error of a pair according to the model
+    def td_error(self, i):
+        target = self.model_reward[i]
+        if self.model_boot[i]:
+            target += self.gamma * self.v[self.model_next[i]]
+        return target - self.q[i]
+
+    # Moves the value of a pair towards its target according to the model
+    def update(self, i):
+        self.set_action_value(i // 4, i % 4, self.q[i] + self.alpha * self.td_error(i))
+
+    # Queues a pair if its TD error is above theta. heapq is a min-heap, so the priorities are negated
+    def queue_pair(self, i):
+        priority = abs(self.td_error(i))
+        if priority > self.theta:
+            heapq.heappush(self.queue, (-priority, i))
+
+    # Runs the planning updates that follow a real step
+    def plan(self):
+        if self.mode == "dyna":
+            observed, random_number = self.observed, self.rng.random
+            for _ in range(self.planning_steps):
+                self.update(observed[int(random_number() * len(observed))])
+                self.planning_updates += 1
+            return
+
+        for _ in range(self.planning_steps):
+            if not self.queue:
+                break
+            i = heapq.heappop(self.queue)[1]
+            # The same pair can be in the queue more than once, the stale entries have nothing left to do
+            if abs(self.td_error(i)) <= self.theta:
+                continue
+            self.update(i)
+            self.planning_updates += 1
+            for j in self.predecessors.get(i // 4, ()):
+                self.queue_pair(j)
+
+    # Generates an episode from the start to the goal, learning from every real step and planning after it. Returns
+    # the return and the length of the episode
+    def generate_episode(self):
+        state, total, length = self.env.start, 0., 0
+        while True:
+            i = 4 * state + self.epsilon_greedy_action(state)
+            new_state, reward, done = self.real_step(i)
+            if self.mode == "dyna":
+                self.update(i)
+            else:
+                self.queue_pair(i)
+            self.plan()
+
+            total += reward
+            length += 1
+            if done:
+                self.episodes += 1
+                self.steps += length
+                return total, length
+            state = new_state
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import time
+
+    from TDLambda import episodes_to_target
+
+    # Real steps and planning updates until the average return is within twice the shortest safe path, against
+    # today's one step Q-Learning, averaged over a few seeds
+    for width, height in [(12, 4), (40, 10)]:
+        env = CliffEnv(width, height)
+        target = -2 * (width + 1)
+        print("{0}x{1} board, target average return {2}".format(width, height, target))
+        learners = [("q-learning", lambda seed: CompiledAgent(env, seed=seed))]
+        learners += [("{} n={}".format(mode, n), lambda seed, mode=mode, n=n: DynaAgent(env, n, mode, seed=seed))
+                     for mode in MODES for n in (10, 50)]
+        for name, make_agent in learners:
+            episodes, real_steps, planning_updates = [], 0, 0
+            start = time.time()
+            for seed in range(5):
+                agent = make_agent(seed)
+                episodes += [episodes_to_target(agent, target)]
+                real_steps += agent.steps
+                planning_updates += getattr(agent, "planning_updates", 0)
+            if None in episodes:
+                print("{0:16}: target not reached".format(name))
+                continue
+            print("{0:16}: {1:7.1f} episodes, {2:9.1f} real steps, {3:10.1f} planning updates, {4:.3f} seconds"
+                  .format(name, sum(episodes) / 5, real_steps / 5, planning_updates / 5, (time.time() - start) / 5))
+        print()
@@ -0,0 +1,99 @@
+# Hogwild style Q-Learning on a CompiledCliff.CliffEnv. Several worker processes run their own episodes, but all of
+# them read and write one set of action values in shared memory, without any locks. Two workers can update the same
+# value at the same time and one of the updates is then lost, which Q-Learning tolerates. The only shared counter that
+# is locked is the number of episodes started, which stops all the workers once the budget is used up
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from CompiledCliff import CliffEnv, CompiledAgent
+
+
+# Returns the action values, the largest values and the greedy actions of a board with n_states states, as arrays
+# laid out one after the other in a shared memory buffer
+def shared_arrays(buffer, n_states):
+    Q = np.ndarray(4 * n_states, dtype=np.float64, buffer=buffer)
+    V = np.ndarray(n_states, dtype=np.float64, buffer=buffer, offset=Q.nbytes)
+    best_actions = np.ndarray(n_states, dtype=np.int8, buffer=buffer, offset=Q.nbytes + V.nbytes)
+    return Q, V, best_actions
+
+
+# The loop of a worker process. Starts episodes until the shared episode counter reaches the budget, then adds the
+# number of steps it took to the shared step counter
+def _run_worker(name, width, height, episodes, budget, steps, epsilon, alpha, gamma, seed):
+    memory = shared_memory.SharedMemory(name=name)
+    env = CliffEnv(width, height)
+    agent = CompiledAgent(env, epsilon, alpha, gamma, seed)
+    agent.use_arrays(*shared_arrays(memory.buf, env.n_states))
+    while True:
+        with episodes.get_lock():
+            if episodes.value >= budget:
+                break
+            episodes.value += 1
+        agent.generate_episode()
+
+    with steps.get_lock():
+        steps.value += agent.steps
+    # The views of the buffer have to be gone before it can be closed
+    del agent
+    memory.close()
+
+
+class HogwildQLearning:
+
+    def __init__(self, env, workers=None, epsilon=0.05, alpha=0.9, gamma=0.9, seed=0):
+        self.env = env
+        self.workers = workers or multiprocessing.cpu_count()
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.gamma = gamma
+        self.seed = seed
+
+        start = CompiledAgent(env)
+        self.Q, self.V, self.best_actions = start.Q, start.V, start.best_actions
+
+    # Runs the given number of episodes, spread over the workers, continuing from the current action values. Returns
+    # the number of environment steps of all the workers, the seconds it took, and the steps per second
+    def run(self, episodes):
+        n_states = self.env.n_states
+        size = self.Q.nbytes + self.V.nbytes + self.best_actions.nbytes
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            arrays = shared_arrays(memory.buf, n_states)
+            for shared, own in zip(arrays, (self.Q, self.V, self.best_actions)):
+                shared[:] = own
+
+            episode_counter = multiprocessing.Value("q", 0)
+            step_counter = multiprocessing.Value("q", 0)
+            start = time.perf_counter()
+            processes = [multiprocessing.Process(
+                target=_run_worker, args=(memory.name, self.env.width, self.env.height, episode_counter, episodes,
+                                          step_counter, self.epsilon, self.alpha, self.gamma,
+                                          None if self.seed is None else "{}-{}".format(self.seed, worker)))
+                for worker in range(self.workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            seconds = time.perf_counter() - start
+
+            self.Q, self.V, self.best_actions = [shared.copy() for shared in arrays]
+            del arrays, shared
+        finally:
+            memory.close()
+            memory.unlink()
+        return {"steps": step_counter.value, "seconds": seconds, "steps_per_second": step_counter.value / seconds}
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    # The throughput for a growing number of workers, it should grow with the number of cores
+    env = CliffEnv(40, 10)
+    print("{} cores".format(multiprocessing.cpu_count()))
+    for workers in [1, 2, 4]:
+        result = HogwildQLearning(env, workers).run(2000)
+        print("{0} workers: {1} steps in {2:.2f} seconds, {3:.0f} steps/s".format(
+            workers, result["steps"], result["seconds"], result["steps_per_second"]))
@@ -0,0 +1,85 @@
+# Runs many cliff walks at the same time, in lockstep, with the same Q-Learning as QLearningCliff.Agent
+# The board is a CompiledCliff.CliffEnv, and the action values of every environment are kept in one array of shape
+# [environments, states, 4]
+import numpy as np
+
+from CompiledCliff import CliffEnv
+
+
+class LockstepQLearning:
+
+    # Takes the grid, a QLearningCliff.Grid or a CliffEnv, and the number of environments. epsilon, alpha and gamma
+    # can either be numbers, or sequences with one value per environment
+    def __init__(self, grid, environments, epsilon=0.05, alpha=0.9, gamma=0.9, seed=None):
+        self.env = grid if isinstance(grid, CliffEnv) else CliffEnv.from_grid(grid)
+        self.environments = environments
+        self.start = self.env.start
+        self.epsilon = np.broadcast_to(np.asarray(epsilon, dtype=float), environments)
+        self.alpha = np.broadcast_to(np.asarray(alpha, dtype=float), environments)
+        self.gamma = np.broadcast_to(np.asarray(gamma, dtype=float), environments)
+        self.rng = np.random.default_rng(seed)
+
+        self.valid_count = self.env.valid_count.astype(np.int64)
+        self.valid_order = self.env.valid_order
+        self.Q = self.env.new_action_values().reshape(-1, 4)[None].repeat(environments, axis=0)
+
+    # Chooses an action in every environment using the epsilon-greedy soft policy. Like State.get_best_action(),
+    # ties go to the first action in State.DIRECTIONS
+    def epsilon_greedy_actions(self, envs, states):
+        greedy = self.Q[envs, states].argmax(axis=1)
+        random_actions = self.valid_order[states, (self.rng.random(len(envs)) * self.valid_count[states]).astype(int)]
+        return np.where(self.rng.random(len(envs)) < self.epsilon[envs], random_actions, greedy)
+
+    # Runs every environment for the given number of episodes, from the start to the goal. Falling in the cliff
+    # sends the agent back to the start without ending the episode. Returns the return and the length of every
+    # episode of every environment, as arrays of shape [environments, episodes]
+    def run(self, episodes):
+        returns = np.zeros((self.environments, episodes))
+        lengths = np.zeros((self.environments, episodes), dtype=np.int64)
+        states = np.full(self.environments, self.start)
+        episode = np.zeros(self.environments, dtype=np.int64)
+        episode_return = np.zeros(self.environments)
+        episode_length = np.zeros(self.environments, dtype=np.int64)
+
+        envs = np.arange(self.environments)
+        while len(envs) > 0:
+            s = states[envs]
+            a = self.epsilon_greedy_actions(envs, s)
+            next_s = self.env.next_state[s, a]
+            reward = self.env.rewards[s, a]
+
+            # Falling in the cliff and reaching the goal do not bootstrap
+            q = self.Q[envs, s, a]
+            next_value = self.gamma[envs] * self.Q[envs, next_s].max(axis=1)
+            target = reward + np.where(self.env.bootstrap[s, a], next_value, 0)
+            self.Q[envs, s, a] = q + self.alpha[envs] * (target - q)
+
+            episode_return[envs] += reward
+            episode_length[envs] += 1
+            states[envs] = next_s
+
+            finished = envs[self.env.done[s, a]]
+            returns[finished, episode[finished]] = episode_return[finished]
+            lengths[finished, episode[finished]] = episode_length[finished]
+            episode[finished] += 1
+            episode_return[finished] = 0
+            episode_length[finished] = 0
+            states[finished] = self.start
+            envs = envs[episode[envs] < episodes]
+
+        return returns, lengths
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import time
+
+    # The learning curve of today's agent, averaged over 500 runs with different seeds
+    start = time.time()
+    lockstep = LockstepQLearning(CliffEnv(12, 4), 500, seed=0)
+    returns, lengths = lockstep.run(500)
+    print("500 runs of 500 episodes in {0:.2f} seconds".format(time.time() - start))
+    for i in range(0, 500, 50):
+        print("Episode {0:3}: average return {1:8.2f}, average length {2:7.2f}"
+              .format(i + 1, returns[:, i].mean(), lengths[:, i].mean()))
@@ -60,6 +60,9 @@ class State:
     # The states are stored with keys being of the form (x, y)
     states_dictionary = {}
 
+    # The (x, y) keys of the states whose action values changed since the last checkpoint, see CliffCheckpoint
+    touched = set()
+
     gr = None
 
     # Initializing the state with its (x, y) coords and its action dictionary
@@ -113,6 +116,7 @@ class State:
     # Sets the action value of certain action in this state
     def set_action_value(self, a, val):
         self.action_dictionary[a] = val
+        State.touched.add((self.x, self.y))
 
 
 # This is the agent
@@ -169,10 +173,9 @@ class Agent:
 
 # ----------------------------------------------------------------------------------------------------
 
-g = Grid(12, 4)
-agent = Agent(g)
-
-# The final episode is printed to console
-agent.generate_episodes(5000)
-
+if __name__ == "__main__":
+    g = Grid(12, 4)
+    agent = Agent(g)
 
+    # The final episode is printed to console
+    agent.generate_episodes(5000)
@@ -0,0 +1,144 @@
+# TD(lambda) control on a CompiledCliff.CliffEnv, with eligibility traces so the reward of a step is passed back to
+# all the recently visited states at once instead of one state per episode. The methods are
+#   "sarsa"           SARSA(lambda), bootstraps from the next action that is actually taken
+#   "watkins"         Watkins's Q(lambda), bootstraps from the greedy action, the traces are cut after an exploratory
+#                     action
+#   "expected_sarsa"  bootstraps from the expected value of the next state under the epsilon-greedy policy
+# The traces are replacing traces kept in a dictionary of the active (state, action) indices, and a trace is dropped
+# once it decays below trace_threshold, so a step costs O(active traces) instead of O(states * actions)
+import random
+
+from CompiledCliff import CliffEnv, CompiledAgent
+
+METHODS = ("sarsa", "watkins", "expected_sarsa")
+
+
+class TDLambdaAgent:
+
+    # A large lam together with a large alpha spreads the -100 of a cliff fall far back along the path, and the early
+    # episodes can then spend a very long time in loops of states that look better than their surroundings
+    def __init__(self, env, method="sarsa", lam=0.5, epsilon=0.05, alpha=0.5, gamma=0.9, trace_threshold=1e-3,
+                 seed=None):
+        if method not in METHODS:
+            raise ValueError("method must be one of {}, not {}".format(", ".join(METHODS), method))
+        self.env = env
+        self.method = method
+        self.lam = lam
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.gamma = gamma
+        self.trace_threshold = trace_threshold
+        self.rng = random.Random(seed)
+        self.Q = env.new_action_values()
+        self.episodes = 0
+        self.steps = 0
+
+        self.q = memoryview(self.Q)
+        self.next_state = memoryview(env.next_state.ravel())
+        self.rewards = memoryview(env.rewards.ravel())
+        self.done = memoryview(env.done.ravel())
+        self.bootstrap = memoryview(env.bootstrap.ravel())
+        self.valid_count = memoryview(env.valid_count)
+        self.valid_order = memoryview(env.valid_order.ravel())
+
+    # Returns the greedy action of a state, ties go to the first action in State.DIRECTIONS
+    def best_action(self, state):
+        q, b = self.q, 4 * state
+        values = (q[b], q[b + 1], q[b + 2], q[b + 3])
+        return values.index(max(values))
+
+    # Chooses an action using the epsilon-greedy soft policy
+    def epsilon_greedy_action(self, state):
+        if self.rng.random() >= self.epsilon:
+            return self.best_action(state)
+        return self.valid_order[4 * state + int(self.rng.random() * self.valid_count[state])]
+
+    # The expected action value of a state under the epsilon-greedy policy
+    def expected_value(self, state):
+        q, b, count = self.q, 4 * state, self.valid_count[state]
+        values = [q[b + a] for a in self.valid_order[b:b + count]]
+        return (1 - self.epsilon) * max(values) + self.epsilon * sum(values) / count
+
+    # Generates an episode from the start to the goal, updating the action values on the go. Returns the return and
+    # the length of the episode
+    def generate_episode(self):
+        q, next_state, rewards, done, bootstrap = self.q, self.next_state, self.rewards, self.done, self.bootstrap
+        alpha, gamma, threshold = self.alpha, self.gamma, self.trace_threshold
+        decay = self.gamma * self.lam
+        traces = {}
+        state = self.env.start
+        a = self.epsilon_greedy_action(state)
+        total, length = 0., 0
+        while True:
+            i = 4 * state + a
+            reward = rewards[i]
+            new_state = next_state[i]
+            next_a = None if done[i] else self.epsilon_greedy_action(new_state)
+            keep_traces = bool(bootstrap[i])
+            if not keep_traces:
+                # Falling in the cliff ends the chain of credit like the goal does, the agent starts over
+                delta = reward - q[i]
+            elif self.method == "sarsa":
+                delta = reward + gamma * q[4 * new_state + next_a] - q[i]
+            elif self.method == "watkins":
+                greedy = q[4 * new_state + self.best_action(new_state)]
+                delta = reward + gamma * greedy - q[i]
+                keep_traces = q[4 * new_state + next_a] == greedy
+            else:
+                delta = reward + gamma * self.expected_value(new_state) - q[i]
+
+            traces[i] = 1.
+            step = alpha * delta
+            for j, e in traces.items():
+                q[j] += step * e
+            if keep_traces:
+                traces = {j: e * decay for j, e in traces.items() if e * decay >= threshold}
+            else:
+                traces = {}
+
+            total += reward
+            length += 1
+            if next_a is None:
+                self.episodes += 1
+                self.steps += length
+                return total, length
+            state, a = new_state, next_a
+
+
+# Runs episodes until the average return of the last window episodes reaches target. Returns the number of
+# episodes, or None if it is not reached in max_episodes
+def episodes_to_target(agent, target, window=20, max_episodes=10000):
+    returns = []
+    for episode in range(1, max_episodes + 1):
+        returns += [agent.generate_episode()[0]]
+        if len(returns) >= window and sum(returns[-window:]) / window >= target:
+            return episode
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import time
+
+    # Episodes and time until the average return is within twice the shortest safe path (up, across and down),
+    # for today's one step Q-Learning and the trace methods, averaged over a few seeds
+    for width, height in [(12, 4), (40, 10)]:
+        env = CliffEnv(width, height)
+        target = -2 * (width + 1)
+        print("{0}x{1} board, target average return {2}".format(width, height, target))
+        learners = [("q-learning", lambda seed: CompiledAgent(env, seed=seed))]
+        learners += [(method, lambda seed, method=method: TDLambdaAgent(env, method, seed=seed)) for method in METHODS]
+        for name, make_agent in learners:
+            episodes, steps = [], []
+            start = time.time()
+            for seed in range(5):
+                agent = make_agent(seed)
+                episodes += [episodes_to_target(agent, target)]
+                steps += [agent.steps]
+            if None in episodes:
+                print("{0:15}: target not reached".format(name))
+                continue
+            print("{0:15}: {1:7.1f} episodes, {2:9.1f} steps, {3:.3f} seconds".format(
+                name, sum(episodes) / 5, sum(steps) / 5, (time.time() - start) / 5))
+        print()
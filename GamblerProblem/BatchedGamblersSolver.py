@@ -0,0 +1,69 @@
+# Value iteration for the Gambler's Problem with many probabilities of heads at once. The values are an array of shape
+# [probabilities, goal + 1], and every sweep works on the rows that have not converged yet, so the rows that converge
+# early stop costing anything. Every row goes through the same sweeps as GamblersSolver with its probability
+import numpy as np
+
+from GamblersSolver import GamblersSolver
+
+
+class BatchedGamblersSolver:
+
+    # probs_heads is a sequence of probabilities of heads. max_elements bounds the size of the [capitals, stakes]
+    # arrays of a chunk of one row, like in GamblersSolver
+    def __init__(self, goal=100, probs_heads=(0.25, 0.4, 0.55), theta=1e-12, max_elements=2**22):
+        self.goal = goal
+        self.probs_heads = np.asarray(probs_heads, dtype=float)
+        self.theta = theta
+        self.V = np.zeros((len(self.probs_heads), goal + 1))
+        self.policy = np.zeros((len(self.probs_heads), goal + 1), dtype=np.int64)
+        self.sweeps = np.zeros(len(self.probs_heads), dtype=np.int64)
+        self.chunk_size = max(1, max_elements // max(1, goal // 2))
+
+    # Returns the values of all the legal stakes of the capitals lo to hi - 1 for the given rows, as an array of
+    # shape [rows, capitals, stakes], the illegal stakes have a value of -inf
+    def stake_values(self, rows, lo, hi):
+        capital = np.arange(lo, hi)[:, None]
+        stakes = np.arange(1, min(hi - 1, self.goal - lo) + 1)
+        legal = stakes <= np.minimum(capital, self.goal - capital)
+        win = np.minimum(capital + stakes, self.goal)
+        lose = np.maximum(capital - stakes, 0)
+        prob_heads = self.probs_heads[rows, None, None]
+        V = self.V[rows]
+        values = prob_heads * ((win == self.goal) + V[:, win]) + (1 - prob_heads) * V[:, lose]
+        return np.where(legal, values, -np.inf)
+
+    # One sweep of value iteration over all the capitals of the given rows, one chunk at a time. Returns the largest
+    # change of a value of every row
+    def sweep(self, rows):
+        diff = np.zeros(len(rows))
+        for lo in range(1, self.goal, self.chunk_size):
+            hi = min(lo + self.chunk_size, self.goal)
+            values = self.stake_values(rows, lo, hi)
+            best = GamblersSolver.best_stakes(values.reshape(-1, values.shape[2])).reshape(values.shape[:2])
+            new_V = np.take_along_axis(values, best[:, :, None], axis=2)[:, :, 0]
+            diff = np.maximum(diff, np.abs(new_V - self.V[rows, lo:hi]).max(axis=1))
+            self.V[rows, lo:hi] = new_V
+            self.policy[rows, lo:hi] = best + 1
+        return diff
+
+    # Sweeps every row until the largest change of its values is below theta. The sweeps of every row are counted
+    # in self.sweeps. Returns the values and the policies, one row per probability of heads
+    def calculate_state_values(self):
+        self.sweeps[:] = 0
+        rows = np.arange(len(self.probs_heads))
+        while len(rows) > 0:
+            self.sweeps[rows] += 1
+            rows = rows[self.sweep(rows) >= self.theta]
+        return self.V, self.policy
+
+
+if __name__ == "__main__":
+    import time
+
+    probs_heads = np.linspace(0.05, 0.95, 19)
+    start = time.time()
+    solver = BatchedGamblersSolver(100, probs_heads)
+    V, policy = solver.calculate_state_values()
+    print("{0} probabilities solved in {1:.2f} seconds".format(len(probs_heads), time.time() - start))
+    for prob_heads, sweeps, values in zip(probs_heads, solver.sweeps, V):
+        print("p = {0:.2f}: {1:4} sweeps, V(50) = {2:.6f}".format(prob_heads, sweeps, values[50]))
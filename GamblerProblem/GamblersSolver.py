@@ -0,0 +1,131 @@
+# Value iteration for the Gambler's Problem, with the goal capital and the probability of heads as parameters
+# Instead of looping over the capitals and stakes, the values of all the stakes of many capitals are computed at once
+# with array indexing. The capitals are processed in chunks, so the memory used stays bounded for large goals
+import time
+
+import numpy as np
+
+
+class GamblersSolver:
+
+    # max_elements bounds the size of the [capitals, stakes] arrays of a chunk
+    def __init__(self, goal=100, prob_heads=0.4, theta=1e-12, max_elements=2**22):
+        self.goal = goal
+        self.prob_heads = prob_heads
+        self.theta = theta
+        self.V = np.zeros(goal + 1)
+        self.policy = np.zeros(goal + 1, dtype=np.int64)
+        self.sweeps = 0
+        self.max_elements = max_elements
+
+        # Every capital has at most goal // 2 legal stakes
+        self.chunk_size = max(1, max_elements // max(1, goal // 2))
+
+    # Returns the values of all the legal stakes of the capitals lo to hi - 1, as an array of shape
+    # [capitals, stakes], the illegal stakes have a value of -inf
+    def stake_values(self, lo, hi):
+        capital = np.arange(lo, hi)[:, None]
+        stakes = np.arange(1, min(hi - 1, self.goal - lo) + 1)
+        legal = stakes <= np.minimum(capital, self.goal - capital)
+        win = np.minimum(capital + stakes, self.goal)
+        lose = np.maximum(capital - stakes, 0)
+        values = self.prob_heads * ((win == self.goal) + self.V[win]) + (1 - self.prob_heads) * self.V[lose]
+        return np.where(legal, values, -np.inf)
+
+    # Picks the best stake of every row of stake values. Like GamblersProblem.py, the stakes are tried from the
+    # smallest up, and a stake only replaces the best one so far if it is better by more than 10**-16
+    @staticmethod
+    def best_stakes(values):
+        maximum = np.full(values.shape[0], -200.)
+        best = np.zeros(values.shape[0], dtype=np.int64)
+        for a, column in enumerate(np.ascontiguousarray(values.T)):
+            better = column > maximum + 10**-16
+            maximum = np.where(better, column, maximum)
+            best[better] = a
+        return best
+
+    # One sweep of value iteration over all the capitals, one chunk at a time. The chunks are updated in place, so a
+    # chunk already uses the new values of the chunks before it. Returns the largest change of a value
+    def sweep(self):
+        diff = 0.
+        for lo in range(1, self.goal, self.chunk_size):
+            hi = min(lo + self.chunk_size, self.goal)
+            values = self.stake_values(lo, hi)
+            best = self.best_stakes(values)
+            new_V = values[np.arange(hi - lo), best]
+            diff = max(diff, np.abs(new_V - self.V[lo:hi]).max())
+            self.V[lo:hi] = new_V
+            self.policy[lo:hi] = best + 1
+        return diff
+
+    # Sweeps until the largest change of a value is below theta. Returns the number of sweeps
+    def calculate_state_values(self):
+        self.sweeps = 0
+        while True:
+            self.sweeps += 1
+            if self.sweep() < self.theta:
+                return self.sweeps
+
+    # Sets V from the values of the same problem with a smaller goal. A capital is placed at the same fraction of the
+    # goal in both problems, and its value is interpolated linearly. V[goal] is 0 since reaching the goal is rewarded
+    # by the transition, so it is taken as 1 (the probability of winning from there) for the interpolation
+    def warm_start(self, coarse_V):
+        probs = np.array(coarse_V, dtype=float)
+        probs[-1] = 1.
+        self.V = np.interp(np.linspace(0, 1, self.goal + 1), np.linspace(0, 1, len(probs)), probs)
+        self.V[0] = self.V[-1] = 0.
+
+    # Coarse to fine value iteration. The problem is solved for goals of goal / 2**k, ... goal / 2, goal, each solved
+    # only up to coarse_theta and used to warm start the next one, and only the last one is solved up to theta
+    # The coarsest goal is the smallest one that is still at least coarsest_goal. Returns a list with the goal, the
+    # sweeps and the seconds of every level, the total number of sweeps is also stored in self.sweeps
+    def calculate_state_values_multigrid(self, coarsest_goal=16, coarse_theta=1e-6):
+        goals = [self.goal]
+        while goals[-1] // 2 >= coarsest_goal:
+            goals += [goals[-1] // 2]
+
+        levels = []
+        coarse_V = None
+        for goal in reversed(goals):
+            start = time.perf_counter()
+            if goal == self.goal:
+                solver = self
+            else:
+                solver = GamblersSolver(goal, self.prob_heads, max(coarse_theta, self.theta), self.max_elements)
+            if coarse_V is not None:
+                solver.warm_start(coarse_V)
+            sweeps = solver.calculate_state_values()
+            levels += [{"goal": goal, "sweeps": sweeps, "seconds": time.perf_counter() - start}]
+            coarse_V = solver.V
+        self.sweeps = sum(level["sweeps"] for level in levels)
+        return levels
+
+
+if __name__ == "__main__":
+    solver = GamblersSolver(100, 0.4)
+    print("Goal 100 converged after {} sweeps".format(solver.calculate_state_values()))
+    print(solver.V.tolist())
+    print(solver.policy.tolist())
+
+    for goal in [1000, 10000]:
+        start = time.time()
+        solver = GamblersSolver(goal, 0.4, theta=1e-9)
+        sweeps = solver.calculate_state_values()
+        print("Goal {0}: {1} sweeps in {2:.2f} seconds".format(goal, sweeps, time.time() - start))
+
+    # Coarse to fine against a cold start. The values agree up to the tolerance, the policies can differ where
+    # several stakes are equally good
+    for goal in [1000, 4000]:
+        start = time.time()
+        cold = GamblersSolver(goal, 0.4, theta=1e-9)
+        cold.calculate_state_values()
+        cold_time = time.time() - start
+
+        start = time.time()
+        warm = GamblersSolver(goal, 0.4, theta=1e-9)
+        levels = warm.calculate_state_values_multigrid()
+        warm_time = time.time() - start
+        print("Goal {0}: cold start {1} sweeps in {2:.2f} seconds, coarse to fine {3} sweeps in {4:.2f} seconds "
+              "({5} sweeps at full size), largest difference {6:.1e}".format(
+                  goal, cold.sweeps, cold_time, warm.sweeps, warm_time, levels[-1]["sweeps"],
+                  np.abs(cold.V - warm.V).max()))
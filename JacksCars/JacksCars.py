@@ -143,17 +143,24 @@ def print_policy():
         print(pol)
 
 
-load_probs_rewards(prob_1, rew_1, lambda_1r, lambda_1d)
-load_probs_rewards(prob_2, rew_2, lambda_2r, lambda_2d)
-
-
-while True:
-    policy_eval()
-    changed = update_policy_t()
-    if changed:
-        break
-
-
-print_policy()
-print("\n\nDONE!!!!!")
+if __name__ == "__main__":
+    from PoissonTables import TableCache
+    from VectorizedJacks import VectorizedJacks
+
+    # The tables are built like load_probs_rewards() does, and cached on disk for the next runs
+    cache = TableCache()
+    prob_1, rew_1 = cache.load(lambda_1r, lambda_1d, ncar_states, max_morning, theta)
+    prob_2, rew_2 = cache.load(lambda_2r, lambda_2d, ncar_states, max_morning, theta)
+
+    # The sweeps are done by the NumPy engine, policy_eval() and update_policy_t() above do the same work in pure Python
+    # schedule can also be "modified", "value" or "prioritized", see VectorizedJacks.solve(). The time and the
+    # Bellman residual of every iteration are printed, to compare them
+    schedule = "policy"
+    jacks = VectorizedJacks(prob_1, prob_2, rew_1, rew_2, max_moves, discount, theta)
+    jacks.solve(schedule, verbose=True)
+
+    V = jacks.V.tolist()
+    policy = jacks.policy.tolist()
+    print_policy()
+    print("\n\nDONE!!!!!")
 
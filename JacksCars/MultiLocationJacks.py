@@ -0,0 +1,146 @@
+# Jack's Car Rental with any number of locations. Every location has its own request and drop off rates, and an action
+# is a transfer vector, the net number of cars each location gains overnight (the vector sums to zero)
+# Given the morning counts, the locations evolve independently, so the expected value of the next state is found by
+# contracting V with the probability table of one location at a time, instead of summing over every joint next state
+import itertools
+
+import numpy as np
+
+from PoissonTables import build_tables
+
+
+class MultiLocationJacks:
+
+    # request_rates and dropoff_rates have one entry per location. At most max_moves cars are moved overnight in
+    # total, each costing move_cost, and every location that starts the day with more than parking_limit cars costs
+    # parking_cost. cache is an optional PoissonTables.TableCache to load the tables from
+    def __init__(self, request_rates, dropoff_rates, ncar_states=21, max_moves=5, discount=0.9, theta=10**(-7),
+                 move_cost=2, parking_limit=10, parking_cost=4, cache=None):
+        self.locations = len(request_rates)
+        self.ncar_states = ncar_states
+        self.max_morning = ncar_states + max_moves
+        self.max_moves = max_moves
+        self.discount = discount
+        self.theta = theta
+        self.sweeps = 0
+
+        self.probs, self.rewards = [], []
+        for l_reqsts, l_drpffs in zip(request_rates, dropoff_rates):
+            load = build_tables if cache is None else cache.load
+            probs, rewards = load(l_reqsts, l_drpffs, ncar_states, self.max_morning, theta)
+            self.probs += [np.asarray(probs)]
+            self.rewards += [np.asarray(rewards)]
+
+        self.actions = self.transfer_vectors(self.locations, max_moves)
+        self.action_costs = move_cost * np.maximum(self.actions, 0).sum(axis=1)
+
+        # The expected reward of the day, minus the parking costs, for every combination of morning counts. Like in
+        # JacksCars.py, the rewards are weighted by the total probability of the truncated tables
+        morning_shape = (self.max_morning,) * self.locations
+        self.morning_rewards = np.zeros(morning_shape)
+        total_prob = np.ones(morning_shape)
+        for l in range(self.locations):
+            self.morning_rewards += self.along_axis(self.rewards[l], l)
+            self.morning_rewards -= parking_cost * self.along_axis(np.arange(self.max_morning) > parking_limit, l)
+            total_prob = total_prob * self.along_axis(self.probs[l].sum(axis=1), l)
+        self.morning_rewards = (self.morning_rewards * total_prob).ravel()
+
+        # The flat index of the morning counts of a state under an action is the flat index of the state's own counts
+        # in the morning grid, plus an offset that only depends on the action
+        strides = self.max_morning ** np.arange(self.locations - 1, -1, -1)
+        counts = np.indices((ncar_states,) * self.locations)
+        self.state_index = np.tensordot(strides, counts, axes=1)
+        self.action_offsets = self.actions @ strides
+
+        self.V = np.zeros((ncar_states,) * self.locations)
+        self.policy = np.zeros((ncar_states,) * self.locations, dtype=np.int64)
+
+    # Returns every transfer vector of a number of locations that moves at most max_moves cars, as an array of shape
+    # [actions, locations]. Only net transfers are listed, moving cars both ways between two locations never helps,
+    # and the vectors are sorted by how many cars they move, so ties go to the cheapest action
+    @staticmethod
+    def transfer_vectors(locations, max_moves):
+        vectors = [d for d in itertools.product(range(-max_moves, max_moves + 1), repeat=locations)
+                   if sum(d) == 0 and sum(x for x in d if x > 0) <= max_moves]
+        vectors.sort(key=lambda d: sum(x for x in d if x > 0))
+        return np.array(vectors, dtype=np.int64).reshape(-1, locations)
+
+    # Reshapes a vector indexed by the count at location l so it broadcasts along axis l of a grid
+    def along_axis(self, vector, l):
+        shape = [1] * self.locations
+        shape[l] = -1
+        return np.reshape(vector, shape)
+
+    # Returns a mask of the states where an action can be taken, a location cannot send more cars than it has
+    def valid_states(self, action):
+        valid = np.ones((self.ncar_states,) * self.locations, dtype=bool)
+        for l, d in enumerate(self.actions[action]):
+            valid &= self.along_axis(np.arange(self.ncar_states) >= -d, l)
+        return valid
+
+    # The expected discounted value of the next state, for every combination of morning counts, as a flat array
+    # The expectation is taken one location at a time, each one a contraction of one axis with its table
+    def next_values(self):
+        W = self.V
+        for l in range(self.locations):
+            W = np.moveaxis(np.tensordot(self.probs[l], W, axes=([1], [l])), 0, l)
+        return self.discount * W.ravel()
+
+    # Evaluate the current policy, one synchronous sweep over all the states at a time
+    def policy_eval(self):
+        morning = self.state_index + self.action_offsets[self.policy]
+        rewards = self.morning_rewards[morning] - self.action_costs[self.policy]
+        while True:
+            new_V = rewards + self.next_values()[morning]
+            self.sweeps += 1
+            diff = np.abs(new_V - self.V).max()
+            self.V = new_V
+            if diff <= self.theta:
+                break
+
+    # Picks the policy while being greedy. An action only replaces the best one so far if it is better by more than
+    # 10**(-9). Returns the index of the best action of every state
+    def greedy_policy(self):
+        values = self.morning_rewards + self.next_values()
+        best_val = np.full(self.V.shape, -np.inf)
+        best_action = np.zeros(self.V.shape, dtype=np.int64)
+        for a in range(len(self.actions)):
+            val = values[self.state_index + self.action_offsets[a]] - self.action_costs[a]
+            better = self.valid_states(a) & (val > best_val + 10**(-9))
+            best_val = np.where(better, val, best_val)
+            best_action[better] = a
+        return best_action
+
+    # Improve the current policy, returns True if the policy has changed
+    def update_policy_t(self):
+        new_policy = self.greedy_policy()
+        has_changed = bool((new_policy != self.policy).any())
+        self.policy = new_policy
+        return has_changed
+
+    # Alternates evaluation and improvement until the policy is stable. Returns the number of rounds
+    def policy_iteration(self):
+        rounds = 0
+        while True:
+            rounds += 1
+            self.policy_eval()
+            if not self.update_policy_t():
+                return rounds
+
+    # Returns the transfer vector of every state under the current policy, shaped [n_1, ..., n_L, locations]
+    def transfers(self):
+        return self.actions[self.policy]
+
+
+if __name__ == "__main__":
+    import time
+
+    for request_rates, dropoff_rates, ncar_states in [([3, 4, 2], [3, 2, 3], 21), ([3, 4, 2, 3], [3, 2, 3, 4], 16)]:
+        start = time.time()
+        jacks = MultiLocationJacks(request_rates, dropoff_rates, ncar_states)
+        rounds = jacks.policy_iteration()
+        print("{0} locations, {1} states, {2} actions: {3} rounds, {4} sweeps in {5:.1f} seconds".format(
+            jacks.locations, jacks.V.size, len(jacks.actions), rounds, jacks.sweeps, time.time() - start))
+        middle = (ncar_states // 2,) * jacks.locations
+        print("With {0} cars everywhere, move {1}, value {2:.2f}\n".format(
+            ncar_states // 2, jacks.transfers()[middle], jacks.V[middle]))
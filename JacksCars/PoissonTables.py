@@ -0,0 +1,105 @@
+# Builds the probability and reward tables of one location of Jack's Car Rental, the same tables that
+# JacksCars.load_probs_rewards() fills in, with array operations on Poisson probabilities computed in log space.
+# The tables are cached on disk, one .npy file per set of parameters, and are memory-mapped when they are loaded
+import hashlib
+import math
+import os
+
+import numpy as np
+
+
+# Returns the Poisson probabilities of 0, 1, 2, ... with expected number l, stopping before the first one that is not
+# above theta, like the while loops of load_probs_rewards()
+def poisson_probs(l, theta):
+    size = int(l + 10 * math.sqrt(l)) + 10
+    while True:
+        x = np.arange(size)
+        probs = np.exp(x * math.log(l) - l - np.array([math.lgamma(k + 1) for k in x])) if l > 0 else (x == 0) * 1.
+        below = np.flatnonzero(probs <= theta)
+        if len(below) > 0:
+            return probs[:below[0]]
+        size *= 2
+
+
+# Builds the tables of a location with request rate l_reqsts and drop off rate l_drpffs. Returns probs, where
+# probs[m][new_n] is the probability of ending the day with new_n cars after starting it with m, and rewards, where
+# rewards[m] is the expected rental income of a day started with m cars
+def build_tables(l_reqsts, l_drpffs, ncar_states, max_morning, theta):
+    req_prob = poisson_probs(l_reqsts, theta)
+    drp_prob = poisson_probs(l_drpffs, theta)
+
+    # satisfied_req[m, req] is the number of requests that can be satisfied with m cars
+    satisfied_req = np.minimum(np.arange(len(req_prob)), np.arange(max_morning)[:, None])
+    rewards = (10 * satisfied_req * req_prob).sum(axis=1)
+
+    # new_n[m, req, drp] is the number of cars at the end of the day
+    new_n = np.clip(np.arange(max_morning)[:, None, None] + np.arange(len(drp_prob)) - satisfied_req[:, :, None],
+                    0, ncar_states - 1)
+    index = (np.arange(max_morning)[:, None, None] * ncar_states + new_n).ravel()
+    weights = np.broadcast_to(req_prob[:, None] * drp_prob, new_n.shape).ravel()
+    probs = np.bincount(index, weights, minlength=max_morning * ncar_states).reshape(max_morning, ncar_states)
+    return probs, rewards
+
+
+# A folder of cached tables. When the files in it take more than max_bytes, the least recently used ones are deleted
+class TableCache:
+    default_directory = os.path.join(os.path.expanduser("~"), ".cache", "JacksCars")
+
+    def __init__(self, directory=default_directory, max_bytes=64 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the path of the file of a set of parameters
+    def path(self, l_reqsts, l_drpffs, ncar_states, max_morning, theta):
+        key = repr((float(l_reqsts), float(l_drpffs), int(ncar_states), int(max_morning), float(theta)))
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest()[:20] + ".npy")
+
+    # Returns the tables of a location, as read-only arrays. They are memory-mapped from the cache if they are in it,
+    # and built and added to the cache otherwise. Both tables are stored in one array, rewards being its last column
+    def load(self, l_reqsts, l_drpffs, ncar_states, max_morning, theta):
+        path = self.path(l_reqsts, l_drpffs, ncar_states, max_morning, theta)
+        try:
+            tables = np.load(path, mmap_mode="r")
+            # The modification time is used as the time of last use
+            os.utime(path)
+            self.hits += 1
+        except (OSError, ValueError):
+            self.misses += 1
+            probs, rewards = build_tables(l_reqsts, l_drpffs, ncar_states, max_morning, theta)
+            tables = np.column_stack([probs, rewards])
+            self.store(path, tables)
+            tables.flags.writeable = False
+        return tables[:, :-1], tables[:, -1]
+
+    # Writes a file to the cache, then makes room for it. The file is written under a temporary name and renamed,
+    # so that a reader never sees half of it
+    def store(self, path, tables):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as f:
+            np.save(f, tables)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+
+    # Deletes the least recently used files until the cache fits in max_bytes. The file keep is never deleted
+    def evict(self, keep=None):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files += [(stat.st_mtime, stat.st_size, path)]
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Another process evicted it first
+                    pass
+                total -= size
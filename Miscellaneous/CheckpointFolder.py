@@ -0,0 +1,111 @@
+# A folder of checkpoints of a learner, so a long run can be stopped and resumed. The folder holds a base file with
+# all the learned values, and delta files with only the values of the states that were updated since the checkpoint
+# before them. Every file also holds the number of episodes run and the state of the random module, so a resumed run
+# goes on exactly like the run that stopped would have. Every compact_every deltas, they are folded into a new base
+# file. All the files are npz files written under a temporary name and renamed, so a crash never leaves half of a
+# file behind. What the values are and how they are packed into arrays is up to the subclasses:
+#   base_arrays(learner)         the arrays of all the values
+#   delta_arrays(learner)        the arrays of the states touched since the last checkpoint
+#   check(learner, data)         raises a ValueError if a base file does not fit the learner
+#   apply(learner, data, base)   sets the values in a base file (base is True) or a delta file
+#   clear_touched(learner)       forgets which states were touched
+#   run_episode(learner)         runs one episode of learning
+import os
+import random
+import time
+
+import numpy as np
+
+
+# The state of the random module as arrays, and back
+def rng_arrays():
+    version, internal, gauss_next = random.getstate()
+    return {"rng_version": version, "rng_state": np.array(internal, dtype=np.uint32),
+            "rng_gauss": np.nan if gauss_next is None else gauss_next}
+
+
+def set_rng(data):
+    gauss_next = float(data["rng_gauss"])
+    random.setstate((int(data["rng_version"]), tuple(data["rng_state"].tolist()),
+                     None if np.isnan(gauss_next) else gauss_next))
+
+
+class CheckpointFolder:
+
+    def __init__(self, directory, compact_every=20):
+        self.directory = directory
+        self.compact_every = compact_every
+        # The number of the last checkpoint written or read. The deltas are numbered on from the base they go on
+        self.sequence = 0
+        self.deltas = 0
+        self.seconds = 0.
+
+    # Returns the path of the base file, or of the delta with the given number
+    def path(self, sequence=None):
+        name = "base.npz" if sequence is None else "delta-{:08d}.npz".format(sequence)
+        return os.path.join(self.directory, name)
+
+    # Writes the arrays to path, under a temporary name first
+    def write(self, path, **arrays):
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+
+    # Saves the learner after the given number of episodes. The first checkpoint and every compact_every-th one write
+    # a base file, the others a delta of the touched states. Returns the seconds it took
+    def save(self, learner, episodes):
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        self.sequence += 1
+        if self.sequence == 1 or self.deltas >= self.compact_every:
+            # The base says which deltas it already holds, older deltas that are still around are skipped on load
+            self.write(self.path(), sequence=self.sequence, episodes=episodes, **self.base_arrays(learner),
+                       **rng_arrays())
+            for sequence in range(self.sequence - self.deltas, self.sequence):
+                if os.path.exists(self.path(sequence)):
+                    os.remove(self.path(sequence))
+            self.deltas = 0
+        else:
+            self.write(self.path(self.sequence), episodes=episodes, **self.delta_arrays(learner), **rng_arrays())
+            self.deltas += 1
+        self.clear_touched(learner)
+        seconds = time.perf_counter() - start
+        self.seconds += seconds
+        return seconds
+
+    # Loads the last checkpoint into the learner, and the random module. Returns the number of episodes it was taken
+    # after, 0 if there is no checkpoint
+    def load(self, learner):
+        if not os.path.exists(self.path()):
+            return 0
+        with np.load(self.path()) as data:
+            self.check(learner, data)
+            self.apply(learner, data, True)
+            self.sequence = int(data["sequence"])
+            episodes = int(data["episodes"])
+            set_rng(data)
+
+        self.deltas = 0
+        while os.path.exists(self.path(self.sequence + 1)):
+            self.sequence += 1
+            self.deltas += 1
+            with np.load(self.path(self.sequence)) as data:
+                self.apply(learner, data, False)
+                episodes = int(data["episodes"])
+                set_rng(data)
+        self.clear_touched(learner)
+        return episodes
+
+    # Runs episodes with the learner until episodes episodes are done, saving a checkpoint every every episodes. If
+    # the folder already has a checkpoint, the run carries on from it, and if that checkpoint is already at episodes
+    # episodes, nothing is run
+    def train(self, learner, episodes, every):
+        done = self.load(learner)
+        while done < episodes:
+            batch = min(every, episodes - done)
+            for _ in range(batch):
+                self.run_episode(learner)
+            done += batch
+            self.save(learner, done)
+        return done
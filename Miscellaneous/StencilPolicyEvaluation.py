@@ -0,0 +1,200 @@
+# Iterative policy evaluation of the equiprobable random policy on a gridworld, like PolicyEvaluation.py, but a full
+# sweep is done with shifted array operations on an edge padded copy of the grid
+import math
+import time
+
+import numpy as np
+
+# SciPy is optional, it is only used to solve the Bellman equations of large grids directly, as a sparse system
+try:
+    import scipy.sparse
+    import scipy.sparse.linalg
+except ImportError:
+    scipy = None
+
+
+class StencilPolicyEvaluation:
+
+    # Takes the grid dimensions, the terminal states as a list of [i, j] pairs, the reward of a move and the gamma in
+    # the Bellman equation
+    def __init__(self, gridW, gridH, terminalStates, moveReward=-1, y=1.):
+        self.terminal = np.zeros((gridW, gridH), dtype=bool)
+        for i, j in terminalStates:
+            self.terminal[i, j] = True
+        self.terminal_cells = np.nonzero(self.terminal)
+        self.moveReward = moveReward
+        self.y = y
+        self.sweeps = 0
+        self.delta = np.inf
+
+        # The grid is the inside of an edge padded array, see backup(). A Jacobi sweep backs up into the inside of a
+        # second one, and the two are swapped. Together with the other work arrays, a sweep does not allocate
+        self.padded = np.zeros((gridW + 2, gridH + 2))
+        self.new_padded = np.zeros((gridW + 2, gridH + 2))
+        self.grid = self.padded[1:-1, 1:-1]
+        self.new_grid = self.new_padded[1:-1, 1:-1]
+        self.diff = np.zeros((gridW, gridH))
+
+        # In the Gauss-Seidel sweep, the cells are updated in two halves, like the black and white squares of a
+        # chess board. None of the four neighbours of a cell has the same colour as the cell, so each half can be
+        # updated at once using the values the other half already has for this sweep. A colour is the two sub-grids
+        # of every other row and column it is made of, (even, even) and (odd, odd) cells for one, (even, odd) and
+        # (odd, even) for the other, so that only the cells of the colour are backed up
+        self.colours = [[self.sub_grid(pi, pj) for pi, pj in parities]
+                        for parities in [((0, 0), (1, 1)), ((0, 1), (1, 0))]]
+        self.colours = [[sub_grid for sub_grid in colour if sub_grid[3].size] for colour in self.colours]
+
+    # Returns the sub-grid of the cells (i, j) with i % 2 == pi and j % 2 == pj as the slices of its cells and of their
+    # four neighbours in the padded grid, the indices of its terminal cells, and work arrays of its shape
+    def sub_grid(self, pi, pj):
+        gridW, gridH = self.terminal.shape
+        rows = [slice(pi + 1 + di, gridW + 1 + di, 2) for di in (-1, 0, 1)]
+        columns = [slice(pj + 1 + dj, gridH + 1 + dj, 2) for dj in (-1, 0, 1)]
+        cells = (rows[1], columns[1])
+        neighbours = [(rows[2], columns[1]), (rows[0], columns[1]), (rows[1], columns[2]), (rows[1], columns[0])]
+        terminal = np.nonzero(self.terminal[pi::2, pj::2])
+        new_values = np.zeros(self.terminal[pi::2, pj::2].shape)
+        return cells, neighbours, terminal, new_values, np.zeros(new_values.shape)
+
+    # Copies the edges of the grid inside padded onto its padding
+    # Moving off the grid leaves the agent where it is, which is the same as padding the grid with a copy of its
+    # edges, so the four neighbours of every cell are slices of the padded grid
+    @staticmethod
+    def pad(padded):
+        padded[0, 1:-1], padded[-1, 1:-1] = padded[1, 1:-1], padded[-2, 1:-1]
+        padded[1:-1, 0], padded[1:-1, -1] = padded[1:-1, 1], padded[1:-1, -2]
+
+    # Backs up every cell of grid into new_grid, terminal states keep their value
+    def backup(self):
+        padded, new_grid = self.padded, self.new_grid
+        self.pad(padded)
+        np.add(padded[2:, 1:-1], padded[:-2, 1:-1], out=new_grid)
+        new_grid += padded[1:-1, 2:]
+        new_grid += padded[1:-1, :-2]
+        new_grid += 4 * self.moveReward
+        new_grid *= 1/4 * self.y
+        new_grid[self.terminal_cells] = self.grid[self.terminal_cells]
+
+    # A synchronous (Jacobi) sweep, every cell is backed up from the values of the previous sweep
+    # Returns the largest change of a value
+    def jacobi_sweep(self):
+        self.backup()
+        np.subtract(self.new_grid, self.grid, out=self.diff)
+        np.abs(self.diff, out=self.diff)
+        self.padded, self.new_padded = self.new_padded, self.padded
+        self.grid, self.new_grid = self.new_grid, self.grid
+        return self.diff.max()
+
+    # An in-place (Gauss-Seidel) sweep, each half of the cells is backed up from the newest values of the other half,
+    # one sub-grid at a time. Returns the largest change of a value
+    def gauss_seidel_sweep(self):
+        padded = self.padded
+        diff = 0.
+        for colour in self.colours:
+            self.pad(padded)
+            for cells, neighbours, terminal, new_values, change in colour:
+                np.add(padded[neighbours[0]], padded[neighbours[1]], out=new_values)
+                new_values += padded[neighbours[2]]
+                new_values += padded[neighbours[3]]
+                new_values += 4 * self.moveReward
+                new_values *= 1/4 * self.y
+                values = padded[cells]
+                new_values[terminal] = values[terminal]
+                np.subtract(new_values, values, out=change)
+                np.abs(change, out=change)
+                diff = max(diff, change.max())
+                values[...] = new_values
+        return diff
+
+    # Sweeps until the largest change of a value is below theta, or max_sweeps is reached
+    # mode is either "jacobi" or "gauss-seidel". Returns the number of sweeps and whether the values converged, the
+    # largest change of the last sweep is kept in delta
+    def evaluate(self, theta=1e-6, max_sweeps=100000, mode="jacobi"):
+        if mode not in ("jacobi", "gauss-seidel"):
+            raise ValueError("mode must be either 'jacobi' or 'gauss-seidel', not {}".format(mode))
+
+        sweep = self.jacobi_sweep if mode == "jacobi" else self.gauss_seidel_sweep
+        self.sweeps = 0
+        self.delta = np.inf
+        while self.sweeps < max_sweeps and self.delta >= theta:
+            self.sweeps += 1
+            self.delta = sweep()
+        return self.sweeps, bool(self.delta < theta)
+
+    # Returns the matrix A and the vector b of the Bellman equations A V = b of the random policy, over the cells in
+    # row-major order. A non-terminal cell has V = 1/4 * y * (4 * moveReward + the sum of its neighbours), a neighbour
+    # off the grid being the cell itself, and a terminal cell keeps its value. A is sparse if sparse is True
+    def bellman_system(self, sparse):
+        gridW, gridH = self.grid.shape
+        cells = np.arange(gridW * gridH).reshape(gridW, gridH)
+        i, j = np.indices((gridW, gridH))
+        neighbours = [cells[np.minimum(i + 1, gridW - 1), j], cells[np.maximum(i - 1, 0), j],
+                      cells[i, np.minimum(j + 1, gridH - 1)], cells[i, np.maximum(j - 1, 0)]]
+
+        moving = ~self.terminal.ravel()
+        rows = np.concatenate([cells.ravel()] + [cells.ravel()[moving]] * 4)
+        columns = np.concatenate([cells.ravel()] + [n.ravel()[moving] for n in neighbours])
+        values = np.concatenate([np.ones(cells.size)] + [np.full(moving.sum(), -1/4 * self.y)] * 4)
+        b = np.where(moving, self.y * self.moveReward, self.grid.ravel())
+
+        if sparse:
+            return scipy.sparse.csr_matrix((values, (rows, columns)), shape=(cells.size, cells.size)), b
+        A = np.zeros((cells.size, cells.size))
+        np.add.at(A, (rows, columns), values)
+        return A, b
+
+    # Evaluates the policy exactly by solving its Bellman equations. The system is sparse if SciPy is installed,
+    # dense otherwise
+    def evaluate_direct(self):
+        if scipy is not None:
+            A, b = self.bellman_system(sparse=True)
+            V = scipy.sparse.linalg.spsolve(A.tocsc(), b)
+        else:
+            A, b = self.bellman_system(sparse=False)
+            V = np.linalg.solve(A, b)
+        self.grid[...] = V.reshape(self.grid.shape)
+
+    # Evaluates the policy. method is "direct", "iterative", or "auto". Sweeping to theta takes at most about
+    # log(theta) / log(y) sweeps, and "auto" only solves directly when that is at least min_direct_sweeps and there are
+    # at most max_direct_states cells, by default 250000 with SciPy's sparse solver and 4000 without it. Without a
+    # discount, sweeping may never get to theta, so "auto" solves directly whenever the grid is small enough. The other
+    # arguments are passed to evaluate(). Returns the method used and the seconds it took
+    def evaluate_policy(self, method="auto", max_direct_states=None, min_direct_sweeps=1000, **sweep_options):
+        if method not in ("auto", "direct", "iterative"):
+            raise ValueError("method must be 'auto', 'direct' or 'iterative', not {}".format(method))
+        if max_direct_states is None:
+            max_direct_states = 4000 if scipy is None else 250000
+        if method == "auto":
+            theta = sweep_options.get("theta", 1e-6)
+            sweeps = math.inf if self.y >= 1 else math.log(theta) / math.log(self.y)
+            method = "direct" if self.grid.size <= max_direct_states and sweeps >= min_direct_sweeps else "iterative"
+
+        start = time.perf_counter()
+        if method == "direct":
+            self.evaluate_direct()
+        else:
+            self.evaluate(**sweep_options)
+        return method, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    # The 4x4 grid from PolicyEvaluation.py, until it converges instead of 500 sweeps
+    for mode in ["jacobi", "gauss-seidel"]:
+        evaluation = StencilPolicyEvaluation(4, 4, [[1, 0], [1, 3]])
+        sweeps, converged = evaluation.evaluate(mode=mode)
+        outcome = "converged" if converged else "stopped without converging"
+        print("{0}: {1} after {2} sweeps\n{3}\n".format(mode, outcome, sweeps, evaluation.grid))
+
+    # A large grid, with a discount so it converges in a reasonable number of sweeps
+    for mode in ["jacobi", "gauss-seidel"]:
+        start = time.time()
+        evaluation = StencilPolicyEvaluation(2000, 2000, [[0, 0], [1999, 1999]], y=0.9)
+        sweeps, converged = evaluation.evaluate(mode=mode)
+        print("2000x2000, {0}: {1} sweeps in {2:.2f} seconds, {3}".format(
+            mode, sweeps, time.time() - start, "converged" if converged else "not converged"))
+
+    # Solving the Bellman equations directly against sweeping, on a 100x100 grid
+    for method in ["direct", "iterative"]:
+        evaluation = StencilPolicyEvaluation(100, 100, [[0, 0], [99, 99]], y=0.9)
+        path, seconds = evaluation.evaluate_policy(method, theta=1e-10)
+        print("100x100, {0}: {1:.3f} seconds, V(50, 50) = {2}".format(path, seconds, evaluation.grid[50, 50]))
@@ -0,0 +1,95 @@
+import numpy
+
+
+# This is the testbed from the book, many independent bandit problems played at the same time. Every run has its own
+# set of arms, and the actual values, the estimated values and the number of pulls of every arm of every run are kept
+# in arrays of shape [runs, arms], so one time step of all the runs is a handful of array operations
+class BanditTestbed:
+
+    # Constructor, gives every arm of every run an actual value of mean zero and variance 1. Every estimate starts at
+    # initial_value, an optimistic one makes the greedy runs explore early on
+    def __init__(self, runs=2000, arms=10, seed=None, initial_value=0.):
+        self.runs = runs
+        self.arms = arms
+        self.initial_value = initial_value
+        self.rng = numpy.random.default_rng(seed)
+        self.rows = numpy.arange(runs)
+        self.actualValues = numpy.zeros((runs, arms))
+        self.avgValues = numpy.full((runs, arms), float(initial_value))
+        self.totalPulls = numpy.zeros((runs, arms), dtype=numpy.int64)
+        self.optimal = numpy.zeros(runs, dtype=numpy.int64)
+        self.randomize_bandits()
+
+    # Re-picks random actual values for all the arms of all the runs
+    def randomize_bandits(self):
+        self.actualValues = self.rng.normal(0, 1, (self.runs, self.arms))
+        self.optimal = self.actualValues.argmax(axis=1)
+
+    # Forgets everything that was learned, the actual values are kept
+    def reset_estimates(self):
+        self.avgValues[:] = self.initial_value
+        self.totalPulls[:] = 0
+
+    # Finds the next lever to pull in every run by being greedy. Ties are broken randomly
+    def find_max_index(self):
+        ties = self.avgValues == self.avgValues.max(axis=1, keepdims=True)
+        return (ties * self.rng.random((self.runs, self.arms))).argmax(axis=1)
+
+    # Picks the lever to pull in every run using the Epsilon greedy method
+    def epsilon_greedy_actions(self, epsilon):
+        explore = self.rng.random(self.runs) < epsilon
+        return numpy.where(explore, self.rng.integers(0, self.arms, self.runs), self.find_max_index())
+
+    # Pulls one lever in every run, returns the rewards (actual value plus a random number)
+    def pull_levers(self, actions):
+        return self.actualValues[self.rows, actions] + self.rng.normal(0, 1, self.runs)
+
+    # Calculates estimated reward based on the incremental method. This just takes the average of all the previous pulls
+    def incremental_value_calculation(self, rewards, actions):
+        estimates = self.avgValues[self.rows, actions]
+        self.avgValues[self.rows, actions] = estimates + (rewards - estimates) / self.totalPulls[self.rows, actions]
+
+    # Like Agent.recency_weighted_avg_value_calculation(), the step size is 1 / alpha
+    def recency_weighted_avg_value_calculation(self, rewards, actions, alpha):
+        estimates = self.avgValues[self.rows, actions]
+        self.avgValues[self.rows, actions] = estimates + (rewards - estimates) / alpha
+
+    # Advances every run by one time step. If alpha is None, the estimates are sample averages, otherwise they are
+    # recency weighted averages. Returns the rewards and whether the optimal lever was pulled, for every run
+    def step(self, epsilon, alpha=None):
+        actions = self.epsilon_greedy_actions(epsilon)
+        rewards = self.pull_levers(actions)
+        self.totalPulls[self.rows, actions] += 1
+        if alpha is None:
+            self.incremental_value_calculation(rewards, actions)
+        else:
+            self.recency_weighted_avg_value_calculation(rewards, actions, alpha)
+        return rewards, actions == self.optimal
+
+    # Plays all the runs for a number of steps. Returns the average reward and the percentage of runs that pulled the
+    # optimal lever, at every step
+    def run(self, steps, epsilon, alpha=None):
+        avg_rewards = numpy.zeros(steps)
+        optimal_actions = numpy.zeros(steps)
+        for i in range(steps):
+            rewards, optimal = self.step(epsilon, alpha)
+            avg_rewards[i] = rewards.mean()
+            optimal_actions[i] = 100 * optimal.mean()
+        return avg_rewards, optimal_actions
+
+
+# ---------------------------------------------------------------------------------------------------------#
+
+if __name__ == "__main__":
+    import time
+
+    # The study from the book, 2000 runs of 1000 steps for a few values of epsilon
+    for epsilon in [0, 0.01, 0.1]:
+        start = time.time()
+        testbed = BanditTestbed(2000, 10, seed=0)
+        avg_rewards, optimal_actions = testbed.run(1000, epsilon)
+        print("Epsilon {0}, done in {1:.2f} seconds".format(epsilon, time.time() - start))
+        for i in range(99, 1000, 100):
+            print("Step {0:4}: average reward {1:.3f}, optimal action {2:.1f}%"
+                  .format(i + 1, avg_rewards[i], optimal_actions[i]))
+        print()
@@ -1,5 +1,4 @@
 import numpy, operator,math
-from msvcrt import getch
 
 
 # This is the slot machine
@@ -0,0 +1,125 @@
+# Runs the bandit testbed for every combination of a grid of parameters (epsilon, step size and initial estimate),
+# spreading the combinations over a process pool. Every combination gets its own random stream, derived from the seed
+# of the study and the parameters of the combination, so its results do not depend on the number of workers, on the
+# order the combinations finish in, or on the other combinations in the grid. The results are written as soon as each
+# combination finishes:
+#   <output>/summary.csv     one row per combination
+#   <output>/<key>.npz       the average reward and the percentage of optimal actions at every step
+# If the study is started again with the same output folder, the combinations already in it are skipped
+#
+#   python ParameterStudy.py --epsilons 0 0.01 0.1 --alphas none 10 --initial-values 0 5
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import os
+import time
+
+import numpy
+
+from BanditTestbed import BanditTestbed
+
+FIELDS = ["key", "epsilon", "alpha", "initial_value", "runs", "steps", "mean_reward", "final_reward",
+          "final_optimal", "seconds"]
+
+
+# Returns the name of a combination, used for its file and to find it when resuming
+def point_key(epsilon, alpha, initial_value):
+    return "eps{0}_alpha{1}_init{2}".format(epsilon, "avg" if alpha is None else alpha, initial_value)
+
+
+# Returns the combinations of the grid, as a list of (epsilon, alpha, initial_value). An alpha of None means sample
+# averages
+def parameter_grid(epsilons, alphas, initial_values):
+    return list(itertools.product(epsilons, alphas, initial_values))
+
+
+# Returns the random stream of a combination. Its spawn key comes from a hash of the key of the combination, so a
+# combination gets the same stream when the grid is extended or reordered and the study resumed
+def point_seed(seed, epsilon, alpha, initial_value):
+    digest = hashlib.sha256(point_key(epsilon, alpha, initial_value).encode()).digest()
+    return numpy.random.SeedSequence(seed, spawn_key=(int.from_bytes(digest[:8], "little"),))
+
+
+# Runs one combination, returns its summary row and its curves
+def run_point(task):
+    (epsilon, alpha, initial_value), runs, steps, seed = task
+    start = time.time()
+    rng_seed = point_seed(seed, epsilon, alpha, initial_value)
+    testbed = BanditTestbed(runs, 10, seed=rng_seed, initial_value=initial_value)
+    avg_rewards, optimal_actions = testbed.run(steps, epsilon, alpha)
+    row = {
+        "key": point_key(epsilon, alpha, initial_value),
+        "epsilon": epsilon,
+        "alpha": "" if alpha is None else alpha,
+        "initial_value": initial_value,
+        "runs": runs,
+        "steps": steps,
+        "mean_reward": avg_rewards.mean(),
+        "final_reward": avg_rewards[-100:].mean(),
+        "final_optimal": optimal_actions[-100:].mean(),
+        "seconds": time.time() - start,
+    }
+    return row, avg_rewards, optimal_actions
+
+
+# Returns the keys of the combinations that are already in the output folder. A combination only counts if both its
+# row and its curves were written
+def finished_keys(output):
+    path = os.path.join(output, "summary.csv")
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as f:
+        return {row["key"] for row in csv.DictReader(f)
+                if os.path.exists(os.path.join(output, row["key"] + ".npz"))}
+
+
+# Runs all the combinations of the grid that are not in the output folder yet. Returns the number that were run
+def run_study(epsilons, alphas, initial_values, runs=2000, steps=1000, workers=None, seed=0, output="study"):
+    os.makedirs(output, exist_ok=True)
+    done = finished_keys(output)
+    tasks = [(point, runs, steps, seed) for point in parameter_grid(epsilons, alphas, initial_values)
+             if point_key(*point) not in done]
+
+    summary_path = os.path.join(output, "summary.csv")
+    new_file = not os.path.exists(summary_path)
+    with open(summary_path, "a", newline="") as f, multiprocessing.Pool(workers) as pool:
+        writer = csv.DictWriter(f, FIELDS)
+        if new_file:
+            writer.writeheader()
+        for row, avg_rewards, optimal_actions in pool.imap_unordered(run_point, tasks):
+            # The curves are written under a temporary name and renamed, then the row is added, so a crash never
+            # leaves a row without its curves
+            temp_path = os.path.join(output, row["key"] + ".tmp.npz")
+            numpy.savez(temp_path, avg_rewards=avg_rewards, optimal_actions=optimal_actions)
+            os.replace(temp_path, os.path.join(output, row["key"] + ".npz"))
+            writer.writerow(row)
+            f.flush()
+            print("{0}: mean reward {1:.3f}, optimal action {2:.1f}% at the end, {3:.1f} seconds".format(
+                row["key"], row["mean_reward"], row["final_optimal"], row["seconds"]))
+    return len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the bandit testbed over a grid of parameters")
+    parser.add_argument("--epsilons", type=float, nargs="+", default=[0, 0.01, 0.1])
+    parser.add_argument("--alphas", nargs="+", default=["none"],
+                        help="step sizes are 1 / alpha, 'none' uses sample averages")
+    parser.add_argument("--initial-values", type=float, nargs="+", default=[0.])
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="study")
+    args = parser.parse_args()
+
+    alphas = [None if alpha.lower() == "none" else float(alpha) for alpha in args.alphas]
+    start = time.time()
+    count = run_study(args.epsilons, alphas, args.initial_values, args.runs, args.steps, args.workers, args.seed,
+                      args.output)
+    print("{0} combinations run in {1:.1f} seconds, results in {2}".format(count, time.time() - start, args.output))
+
+
+if __name__ == "__main__":
+    main()
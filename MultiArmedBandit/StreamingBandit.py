@@ -0,0 +1,110 @@
+# A single epsilon greedy agent playing a non-stationary bandit for a very long time, 10**8 steps or more. The actual
+# values of the arms drift as random walks, and can also be re-picked every so often like MultiArmedBandit.py does
+# The random numbers are drawn in blocks into preallocated arrays instead of one call per pull, and the statistics
+# are reported per window of steps by a generator, so the memory used does not grow with the number of steps
+import numpy
+
+
+class StreamingBandit:
+
+    # drift is the standard deviation of the step of the random walk of every actual value, per time step. If
+    # reset_every is set, all the actual values are re-picked every reset_every steps. If alpha is None the estimates
+    # are sample averages, otherwise the step size is 1 / alpha, like Agent.recency_weighted_avg_value_calculation()
+    def __init__(self, arms=10, epsilon=0.1, alpha=None, drift=0.01, reset_every=None, initial_value=0.,
+                 block_size=2**16, seed=None):
+        self.arms = arms
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.drift = drift
+        self.reset_every = reset_every
+        self.block_size = block_size
+        self.rng = numpy.random.default_rng(seed)
+        self.steps = 0
+
+        self.actualValues = self.rng.normal(0, 1, arms)
+        self.avgValues = [float(initial_value)] * arms
+        self.totalPulls = [0] * arms
+
+        # The buffers of one block, refilled in place
+        self.uniforms = numpy.zeros((block_size, 2))
+        self.noise = numpy.zeros(block_size)
+        self.means = numpy.zeros((block_size, arms))
+        self.actions = numpy.zeros(block_size, dtype=numpy.int64)
+        self.rewards = numpy.zeros(block_size)
+
+    # Re-picks random actual values for all the arms
+    def randomize_bandits(self):
+        self.actualValues = self.rng.normal(0, 1, self.arms)
+
+    # Plays n steps, at most block_size, with the actual values drifting. Returns the sum of the rewards and the
+    # number of times the optimal arm was pulled
+    def play_block(self, n):
+        uniforms, noise, means = self.uniforms[:n], self.noise[:n], self.means[:n]
+        self.rng.random(out=uniforms)
+        self.rng.standard_normal(out=noise)
+
+        # The actual values of every step of the block, the random walk is a cumulative sum of normal steps
+        self.rng.standard_normal(out=means)
+        means *= self.drift
+        numpy.cumsum(means, axis=0, out=means)
+        means += self.actualValues
+        self.actualValues = means[-1].copy()
+
+        avg_values, total_pulls = self.avgValues, self.totalPulls
+        epsilon, arms, alpha = self.epsilon, self.arms, self.alpha
+        actions = [0] * n
+        rewards = [0.] * n
+        flat_means = means.ravel().tolist()
+        for t, explore, arm, r in zip(range(n), uniforms[:, 0].tolist(), uniforms[:, 1].tolist(), noise.tolist()):
+            if explore < epsilon:
+                index = int(arm * arms)
+            else:
+                index = avg_values.index(max(avg_values))
+            reward = flat_means[t * arms + index] + r
+            total_pulls[index] += 1
+            avg_values[index] += (reward - avg_values[index]) / (total_pulls[index] if alpha is None else alpha)
+            actions[t] = index
+            rewards[t] = reward
+
+        self.actions[:n] = actions
+        self.rewards[:n] = rewards
+        self.steps += n
+        optimal = int((self.actions[:n] == means.argmax(axis=1)).sum())
+        return float(self.rewards[:n].sum()), optimal
+
+    # Plays the given number of steps. Yields the statistics of every window of window steps, as a dictionary with
+    # the last step of the window, the mean reward, the percentage of optimal pulls, and the root mean square error of
+    # the estimates at the end of the window
+    def run(self, steps, window=100000):
+        end = self.steps + steps
+        while self.steps < end:
+            window_end = min(self.steps + window, end)
+            reward_sum, optimal, count = 0., 0, window_end - self.steps
+            while self.steps < window_end:
+                if self.reset_every is not None and self.steps % self.reset_every == 0:
+                    self.randomize_bandits()
+                n = min(self.block_size, window_end - self.steps)
+                if self.reset_every is not None:
+                    n = min(n, self.reset_every - self.steps % self.reset_every)
+                block_reward, block_optimal = self.play_block(n)
+                reward_sum += block_reward
+                optimal += block_optimal
+            error = numpy.sqrt(((numpy.array(self.avgValues) - self.actualValues) ** 2).mean())
+            yield {"step": self.steps, "mean_reward": reward_sum / count, "optimal": 100 * optimal / count,
+                   "estimate_error": float(error)}
+
+
+# ---------------------------------------------------------------------------------------------------------#
+
+if __name__ == "__main__":
+    import time
+
+    # Sample averages stop tracking the drifting values, a constant step size keeps up with them
+    for alpha in [None, 10]:
+        start = time.time()
+        bandit = StreamingBandit(epsilon=0.1, alpha=alpha, drift=0.001, seed=0)
+        print("Alpha {}".format(alpha))
+        for stats in bandit.run(10**6, window=10**5):
+            print("Step {0:9}: average reward {1:.3f}, optimal action {2:.1f}%, estimate error {3:.3f}".format(
+                stats["step"], stats["mean_reward"], stats["optimal"], stats["estimate_error"]))
+        print("{0} steps in {1:.1f} seconds\n".format(bandit.steps, time.time() - start))
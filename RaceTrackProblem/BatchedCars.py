@@ -0,0 +1,142 @@
+# Drives a batch of cars on a race track at the same time. The cars are arrays of state ids, which stand for their
+# positions and speeds, and one step of all of them is a few array operations on the tables compiled by the Track:
+# epsilon-greedy actions against an array of action values, the next states (with the clipping of Track.drive()
+# already done), the rewards, and the finish mask. Every episode is capped at max_steps, and a car that finishes is
+# started on a new episode right away, so the batch stays full
+import numpy as np
+
+import TrackUtils as tu
+
+
+class BatchedCars:
+
+    def __init__(self, track, batch_size=256, epsilon=0.5, max_steps=1000, seed=None):
+        self.track = track
+        self.batch_size = batch_size
+        self.epsilon = epsilon
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(batch_size)
+
+        # The state id of every start cell and pair of speeds, indexed by [start cell, xspeed, yspeed]
+        speeds = range(tu.Car.max_speed + 1)
+        self.start_ids = np.array([[[track.state_id(cell, xspeed, yspeed) for yspeed in speeds] for xspeed in speeds]
+                                   for cell in track.start])
+        self.valid_count = track.valid_actions.sum(axis=1)
+        self.valid_order = np.argsort(~track.valid_actions, axis=1, kind="stable")
+
+        # The current state of every car, and the trajectory of its current episode
+        self.sids = np.zeros(batch_size, dtype=np.int64)
+        self.lengths = np.zeros(batch_size, dtype=np.int64)
+        self.states = np.zeros((batch_size, max_steps), dtype=np.int32)
+        self.actions = np.zeros((batch_size, max_steps), dtype=np.int8)
+        self.rewards = np.zeros((batch_size, max_steps), dtype=np.int8)
+        self.greedy = np.zeros((batch_size, max_steps), dtype=bool)
+        self.steps = 0
+        self.truncated = 0
+        self.reset_cars(self.rows)
+
+    # Puts the given cars on random start cells with random speeds, like Car.random_start_position(): both speeds
+    # are picked from 0 to max_speed, and if both are 0, one of them is set to 1
+    def reset_cars(self, cars):
+        speeds = self.rng.integers(0, tu.Car.max_speed + 1, (len(cars), 2))
+        standing = (speeds == 0).all(axis=1)
+        speeds[standing, self.rng.integers(0, 2, standing.sum())] = 1
+        cells = self.rng.integers(0, len(self.start_ids), len(cars))
+        self.sids[cars] = self.start_ids[cells, speeds[:, 0], speeds[:, 1]]
+        self.lengths[cars] = 0
+
+    # Returns the position and the speeds of every car, as an array of shape [batch_size, 4]
+    def positions(self):
+        return np.array(self.track.state_tuples)[self.sids]
+
+    # Returns the greedy action of every car for the action values Q, an array indexed by [state id, action index].
+    # The actions that are not allowed are never picked, and ties go to the first of them. ActionValueStore breaks
+    # ties of Q by N and then D, so to follow a store exactly, give its best_actions as greedy_actions instead, see
+    # episodes(). In a state where every allowed action is still at -inf, like ActionValueStore starts them, the
+    # argmax would pick action 0 whether it is allowed or not, so the first allowed action is taken instead
+    def greedy_actions(self, Q):
+        values = np.where(self.track.valid_actions[self.sids], Q[self.sids], -np.inf)
+        best = values.argmax(axis=1)
+        unvisited = values[self.rows, best] == -np.inf
+        return np.where(unvisited, self.valid_order[self.sids, 0], best)
+
+    # Moves every car one step, with the epsilon-greedy policy of the action values Q, or of the array of greedy
+    # actions greedy_actions, indexed by state id, if it is given. Returns the episodes that finished, as arrays with
+    # one row per episode: states, actions, rewards and greedy (which marks the steps that took the greedy action) of
+    # shape [episodes, longest episode], padded after the end of the shorter ones, then the lengths of the episodes,
+    # and truncated, which is True for the episodes that were cut at max_steps
+    def step(self, Q=None, greedy_actions=None):
+        # A car can only be on the finish at the start of an episode. Like Car.off_policy_episode() skips such an
+        # episode, the car is just started again
+        on_finish = np.flatnonzero(self.track.finish_states[self.sids])
+        while len(on_finish) > 0:
+            self.reset_cars(on_finish)
+            on_finish = on_finish[self.track.finish_states[self.sids[on_finish]]]
+
+        sids = self.sids
+        greedy_action = self.greedy_actions(Q) if greedy_actions is None else greedy_actions[sids]
+        random_action = self.valid_order[sids, (self.rng.random(self.batch_size) * self.valid_count[sids]).astype(int)]
+        actions = np.where(self.rng.random(self.batch_size) < self.epsilon, random_action, greedy_action)
+
+        steps = self.lengths
+        self.states[self.rows, steps] = sids
+        self.actions[self.rows, steps] = actions
+        self.rewards[self.rows, steps] = self.track.rewards[sids, actions]
+        self.greedy[self.rows, steps] = actions == greedy_action
+        self.lengths += 1
+        self.steps += self.batch_size
+
+        terminal = self.track.terminal[sids, actions]
+        self.sids = self.track.next_state[sids, actions].astype(np.int64)
+        if self.sids.min() < 0:
+            raise ValueError("a car took an action that is not allowed in its state")
+        capped = ~terminal & (self.lengths >= self.max_steps)
+        done = np.flatnonzero(terminal | capped)
+        self.truncated += int(capped.sum())
+
+        lengths = self.lengths[done]
+        longest = lengths.max() if len(done) > 0 else 0
+        finished = tuple(table[done, :longest] for table in (self.states, self.actions, self.rewards, self.greedy))
+        finished += (lengths, capped[done])
+        self.reset_cars(done)
+        return finished
+
+    # Yields finished episodes until count of them have been yielded, every one as a tuple (states, actions,
+    # rewards, greedy, truncated), see step(). If an ActionValueStore is given as action_values, the greedy actions
+    # are its best_actions at the start, so ties are broken like the store breaks them
+    def episodes(self, count, Q=None, greedy_actions=None, action_values=None):
+        if action_values is not None and greedy_actions is None:
+            greedy_actions = np.array(action_values.best_actions)
+        while count > 0:
+            states, actions, rewards, greedy, lengths, truncated = self.step(Q, greedy_actions)
+            for k, length in enumerate(lengths[:count].tolist()):
+                yield states[k, :length], actions[k, :length], rewards[k, :length], greedy[k, :length], truncated[k]
+            count -= min(count, len(lengths))
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    # Throughput of the random early policy, against driving one car at a time with Car.generate_episode()
+    for choice in [1, 2]:
+        track = tu.Track.make_default_track(choice)
+        car = tu.Car(track)
+        random.seed(0)
+        start = time.time()
+        steps = 0
+        for _ in range(2000):
+            car.reset()
+            car.generate_episode()
+            steps += len(car.trajectory)
+        single_rate = steps / (time.time() - start)
+
+        cars = BatchedCars(track, 1024, epsilon=0.5, max_steps=1000, seed=0)
+        start = time.time()
+        lengths = [len(states) for states, _, _, _, _ in cars.episodes(20000, action_values=car.action_values)]
+        batched_rate = cars.steps / (time.time() - start)
+        print("Track {0}: one car {1:.0f} steps/s, batch of 1024 {2:.0f} steps/s, average episode length {3:.1f}, "
+              "{4} episodes truncated".format(choice, single_rate, batched_rate, np.mean(lengths), cars.truncated))
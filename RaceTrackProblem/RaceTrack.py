@@ -1,6 +1,7 @@
 import random
 
 import TrackUtils as tu
+from TrackCheckpoint import train
 from collections import defaultdict
 track_values = [[0, 2], [-1, 4, 2], [2, 3, 2]]
 
@@ -9,7 +10,14 @@ track = tu.Track.make_default_track()
 track2 = tu.Track(track_values)
 print(track)
 car = tu.Car(track)
-car.off_policy_monte_carlo(2000000)
+# Set checkpoint_directory to a folder to save checkpoints there every 10000 episodes. If the run is stopped, running
+# this again with the same folder carries on from the last checkpoint, and a folder from a run that finished is used
+# as it is, without training again. off_policy_monte_carlo(n) runs n + 1 episodes, so does the checkpointed run
+checkpoint_directory = None
+if checkpoint_directory is None:
+    car.off_policy_monte_carlo(2000000)
+else:
+    train(car, 2000001, checkpoint_directory)
 print(car.optimal_trajectory())
 
 
@@ -0,0 +1,85 @@
+# Checkpoints of a Car learning with off-policy Monte Carlo, see Miscellaneous/CheckpointFolder.py. The files hold the
+# (Q, N, D) values and best actions of the ActionValueStore, all of their rows in a base file, and only the rows in
+# ActionValueStore.touched in a delta file
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+import TrackUtils as tu
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Miscellaneous"))
+from CheckpointFolder import CheckpointFolder
+
+
+class TrackCheckpoint(CheckpointFolder):
+
+    def base_arrays(self, car):
+        values = car.action_values
+        return {"Q": values.Q, "N": values.N, "D": values.D, "best": np.array(values.best_actions, dtype=np.int8)}
+
+    def delta_arrays(self, car):
+        values = car.action_values
+        sids = np.flatnonzero(values.touched)
+        best = np.array([values.best_actions[sid] for sid in sids.tolist()], dtype=np.int8)
+        return {"sids": sids.astype(np.int32), "Q": values.Q[sids], "N": values.N[sids], "D": values.D[sids],
+                "best": best}
+
+    def check(self, car, data):
+        values = car.action_values
+        if data["Q"].shape != values.Q.shape:
+            raise ValueError("The checkpoint in {} is of a track with {} states, not {}".format(
+                self.directory, data["Q"].shape[0], values.Q.shape[0]))
+
+    def apply(self, car, data, base):
+        values = car.action_values
+        sids = slice(None) if base else data["sids"]
+        values.Q[sids], values.N[sids], values.D[sids] = data["Q"], data["N"], data["D"]
+        if base:
+            values.best_actions[:] = data["best"].tolist()
+            return
+        for sid, a in zip(data["sids"].tolist(), data["best"].tolist()):
+            values.best_actions[sid] = a
+
+    def clear_touched(self, car):
+        car.action_values.touched[:] = False
+
+    def run_episode(self, car):
+        car.off_policy_episode()
+
+
+# Runs off-policy Monte Carlo on the car until episodes episodes are done, saving a checkpoint in directory every
+# every episodes. If the folder already has a checkpoint, the run carries on from it. Returns the checkpoint
+def train(car, episodes, directory, every=10000, compact_every=20):
+    checkpoint = TrackCheckpoint(directory, compact_every)
+    checkpoint.train(car, episodes, every)
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Learns the race track with off-policy Monte Carlo, with "
+                                                 "checkpoints, and carries on from the last one if there is one. A "
+                                                 "checkpoint that already has all the episodes is used as it is")
+    parser.add_argument("--track", type=int, choices=[1, 2], default=1)
+    parser.add_argument("--episodes", type=int, default=2000001)
+    parser.add_argument("--every", type=int, default=10000, help="episodes between checkpoints")
+    parser.add_argument("--compact-every", type=int, default=20, help="deltas between base files")
+    parser.add_argument("--directory", required=True)
+    parser.add_argument("--seed", type=int, default=None, help="only used when there is no checkpoint yet")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    car = tu.Car(tu.Track.make_default_track(args.track))
+    start = time.time()
+    checkpoint = train(car, args.episodes, args.directory, args.every, args.compact_every)
+    seconds = time.time() - start
+    print("Done in {0:.1f} seconds, {1:.2f} of them ({2:.2f}%) on checkpoints".format(
+        seconds, checkpoint.seconds, 100 * checkpoint.seconds / seconds))
+    print(car.optimal_trajectory())
+
+
+if __name__ == "__main__":
+    main()
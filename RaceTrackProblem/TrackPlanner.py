@@ -0,0 +1,152 @@
+# Solves the race track by planning instead of sampling. The dynamics are deterministic and already compiled by the
+# Track into tables indexed by [state id, action index], so the optimal action values can be computed directly, with
+# value iteration over all the states at once, or when every step has the same reward, with a breadth first sweep
+# backwards from the finish that counts the steps left. The result is written into the ActionValueStore of a Car, so
+# Car.optimal_trajectory() drives with the planned policy
+import time
+
+import numpy as np
+
+import TrackUtils as tu
+
+
+class TrackPlanner:
+
+    # discount is the same as the one used by Car.off_policy_episode()
+    def __init__(self, track, discount=0.9, theta=1e-9):
+        self.track = track
+        self.discount = discount
+        self.theta = theta
+        self.V = np.zeros(len(track.state_tuples))
+        self.Q = None
+        self.sweeps = 0
+
+    # The ids of the states a car can start in: a start cell, with speeds that are not both 0
+    def start_states(self):
+        return np.array([self.track.state_id(coords, xspeed, yspeed)
+                         for coords in self.track.start
+                         for xspeed in range(tu.Car.max_speed + 1)
+                         for yspeed in range(tu.Car.max_speed + 1)
+                         if xspeed != 0 or yspeed != 0])
+
+    # Returns a mask of the states that can be reached from the start states, following the transition graph
+    def reachable_states(self):
+        reachable = np.zeros(len(self.V), dtype=bool)
+        frontier = self.start_states()
+        while len(frontier) > 0:
+            reachable[frontier] = True
+            # The finish ends the episode, nothing is driven from there
+            frontier = frontier[~self.track.finish_states[frontier]]
+            successors = self.track.next_state[frontier][self.track.valid_actions[frontier]]
+            frontier = np.unique(successors[~reachable[successors]])
+        return reachable
+
+    # The action values of all the states under the current V, -inf for the actions that are not allowed
+    def action_values(self):
+        track = self.track
+        next_values = np.where(track.terminal, 0., self.V[track.next_state])
+        return np.where(track.valid_actions, track.rewards + self.discount * next_values, -np.inf)
+
+    # Value iteration until the largest change of a value is at most theta. Returns the number of sweeps
+    def value_iteration(self):
+        self.sweeps = 0
+        while True:
+            self.sweeps += 1
+            self.Q = self.action_values()
+            new_V = np.where(self.track.finish_states, 0., self.Q.max(axis=1))
+            diff = np.abs(new_V - self.V).max()
+            self.V = new_V
+            if diff <= self.theta:
+                return self.sweeps
+
+    # When every step has the same reward r, the best policy takes the fewest steps to the finish, and a state that
+    # is d steps away is worth r * (1 + discount + ... + discount**(d - 1)). The distances are found with sweeps
+    # backwards from the finish, every sweep settling the states one step further. Raises a ValueError if the steps
+    # do not all have the same reward. Returns the number of sweeps
+    def shortest_paths(self):
+        track = self.track
+        rewards = track.rewards[track.valid_actions]
+        if not (rewards == rewards[0]).all():
+            raise ValueError("the shortest paths only solve a track where every step has the same reward")
+        reward = rewards[0]
+        distance = np.where(track.finish_states, 0, np.inf)
+        self.sweeps = 0
+        while True:
+            self.sweeps += 1
+            steps = 1 + np.where(track.terminal, 0, distance[track.next_state])
+            new_distance = np.where(track.finish_states, 0, np.where(track.valid_actions, steps, np.inf).min(axis=1))
+            if np.array_equal(new_distance, distance):
+                break
+            distance = new_distance
+
+        self.V = reward * (1 - self.discount ** distance) / (1 - self.discount)
+        self.Q = self.action_values()
+        return self.sweeps
+
+    # Solves the track. method is "value_iteration", "shortest_paths", or "auto", which uses the shortest paths when
+    # all the rewards are the same. Returns the method used and the seconds it took
+    def solve(self, method="auto"):
+        if method not in ("auto", "value_iteration", "shortest_paths"):
+            raise ValueError("method must be 'auto', 'value_iteration' or 'shortest_paths', not {}".format(method))
+        if method == "auto":
+            rewards = self.track.rewards[self.track.valid_actions]
+            method = "shortest_paths" if (rewards == rewards[0]).all() else "value_iteration"
+
+        start = time.perf_counter()
+        if method == "shortest_paths":
+            self.shortest_paths()
+        else:
+            self.value_iteration()
+        return method, time.perf_counter() - start
+
+    # Writes the planned action values into the ActionValueStore of a car, and updates its best actions. Every
+    # valid action gets N = Q and D = 1, so Q stays N / D, and Monte Carlo learning can carry on from there
+    def apply_to(self, car):
+        values = car.action_values
+        valid = self.track.valid_actions
+        values.Q[:] = self.Q
+        values.N[:] = np.where(valid, self.Q, 0.)
+        values.D[:] = valid
+        values.touched[:] = True
+        values.update_best_actions(np.arange(len(self.V)))
+
+    # Evaluates the greedy policy of a car exactly, returns the value of every state under it
+    def policy_values(self, car):
+        track = self.track
+        sids = np.arange(len(self.V))
+        actions = np.array(car.action_values.best_actions)
+        rewards = track.rewards[sids, actions]
+        next_state = track.next_state[sids, actions]
+        terminal = track.terminal[sids, actions] | track.finish_states
+        V = np.zeros(len(self.V))
+        while True:
+            new_V = np.where(track.finish_states, 0., rewards + self.discount * np.where(terminal, 0., V[next_state]))
+            if np.abs(new_V - V).max() <= self.theta:
+                return new_V
+            V = new_V
+
+
+# ----------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import random
+
+    for choice in [1, 2]:
+        track = tu.Track.make_default_track(choice)
+        planner = TrackPlanner(track)
+        method, seconds = planner.solve()
+        starts = planner.start_states()
+        print("Track {0}: {1} states, {2} reachable, solved by {3} in {4:.3f} seconds ({5} sweeps)".format(
+            choice, len(planner.V), planner.reachable_states().sum(), method, seconds, planner.sweeps))
+
+        # The planned policy against the one learned by Monte Carlo, as the average value of the start states
+        random.seed(0)
+        car = tu.Car(track)
+        start = time.perf_counter()
+        car.off_policy_monte_carlo(20000)
+        mc_seconds = time.perf_counter() - start
+        mc_value = planner.policy_values(car)[starts].mean()
+        planner.apply_to(car)
+        print("Average start value: planned {0:.3f}, Monte Carlo after 20000 episodes ({1:.1f} seconds) {2:.3f}"
+              .format(planner.policy_values(car)[starts].mean(), mc_seconds, mc_value))
+        print(car.optimal_trajectory())
@@ -12,8 +12,11 @@
  one copy of that row.
     Rows that do not span the whole square grid have None entries to fill the blanks
  """
+import multiprocessing
 import random
 
+import numpy as np
+
 
 class Track:
     default_values1 = [[0, 6, 3], [-1, 7, 7], [-1, 8, 8], [-1, 9, 7], [0, 10],
@@ -37,6 +40,16 @@ class Track:
         self.find_default_finish()
         self.start_finish_aesthetics()
 
+        # Dense transition tables, filled in by compile_transitions()
+        self.state_tuples = []
+        self.state_ids = {}
+        self.next_state = None
+        self.rewards = None
+        self.terminal = None
+        self.valid_actions = None
+        self.finish_states = None
+        self.compile_transitions()
+
     # Return a string representation of the 2d grid. None cells are represented by an X
     def __str__(self):
         if not self.track:
@@ -142,6 +155,78 @@ class Track:
         for coord in self.finish:
             self.set(coord[0], coord[1], "Finish")
 
+    # Returns the position reached by driving from position with the given speeds. If the car drives off the edge,
+    # the move is clipped by moving one step up then one step right, alternately, for as long as either one is
+    # possible. If the car could not move at all, it is moved once right or up, whichever is a valid cell
+    def drive(self, position, horizontal_speed, vertical_speed):
+        new_pos = [position[0] + horizontal_speed, position[1] + vertical_speed]
+        if self.valid_cell(new_pos):
+            return new_pos
+
+        new_pos = [position[0], position[1]]
+        remaining_x_moves, remaining_y_moves = horizontal_speed, vertical_speed
+        moved, going_up = True, True
+        while True:
+            remaining = remaining_y_moves if going_up else remaining_x_moves
+            valid = False
+            if remaining > 0:
+                coords = [new_pos[0] + (0 if going_up else 1), new_pos[1] + (1 if going_up else 0)]
+                valid = self.valid_cell(coords)
+            if valid:
+                new_pos = coords
+                remaining_x_moves -= 0 if going_up else 1
+                remaining_y_moves -= 1 if going_up else 0
+            if not (valid or moved):
+                break
+            moved, going_up = valid, not going_up
+
+        # Checking if the agent moved. We do this because the agent must move after each step
+        if new_pos == [position[0], position[1]]:
+            coords = [position[0] + 1, position[1]]
+            coords2 = [position[0], position[1] + 1]
+            if self.valid_cell(coords):
+                return coords
+            elif self.valid_cell(coords2):
+                return coords2
+        return new_pos
+
+    # Compiles the dynamics of the track, once, into dense tables indexed by [state id, action index], where the
+    # action index is the position of the action in ActionValueStore.actions. A state is a tuple
+    # (xpos, ypos, xspeed, yspeed), and its id is its index in state_tuples. next_state is -1 for the actions that
+    # are not allowed in a state
+    def compile_transitions(self):
+        speeds = range(Car.max_speed + 1)
+        for j, row in enumerate(self.track):
+            for k, val in enumerate(row):
+                if val is not None:
+                    for xspeed in speeds:
+                        for yspeed in speeds:
+                            self.state_ids[(k - self.offset, j, xspeed, yspeed)] = len(self.state_tuples)
+                            self.state_tuples += [(k - self.offset, j, xspeed, yspeed)]
+
+        n_states, n_actions = len(self.state_tuples), len(ActionValueStore.actions)
+        finish = set((coords[0], coords[1]) for coords in self.finish)
+        self.next_state = np.full((n_states, n_actions), -1, dtype=np.int32)
+        self.rewards = np.zeros((n_states, n_actions), dtype=np.int32)
+        self.terminal = np.zeros((n_states, n_actions), dtype=bool)
+        self.valid_actions = np.zeros((n_states, n_actions), dtype=bool)
+        self.finish_states = np.array([(s[0], s[1]) in finish for s in self.state_tuples], dtype=bool)
+
+        for sid, (xpos, ypos, xspeed, yspeed) in enumerate(self.state_tuples):
+            for a, action in enumerate(ActionValueStore.actions):
+                new_xspeed, new_yspeed = xspeed + action[0], yspeed + action[1]
+                if not ActionValueStore.is_valid_speed(new_xspeed, new_yspeed):
+                    continue
+                new_pos = self.drive([xpos, ypos], new_xspeed, new_yspeed)
+                self.valid_actions[sid, a] = True
+                self.next_state[sid, a] = self.state_ids[(new_pos[0], new_pos[1], new_xspeed, new_yspeed)]
+                self.rewards[sid, a] = -1 if self.valid_cell((xpos + new_xspeed, ypos + new_yspeed)) else -5
+                self.terminal[sid, a] = (new_pos[0], new_pos[1]) in finish
+
+    # Returns the id of the state (xpos, ypos, xspeed, yspeed) in the compiled tables
+    def state_id(self, position, horizontal_speed, vertical_speed):
+        return self.state_ids[(position[0], position[1], horizontal_speed, vertical_speed)]
+
     # Factory method that returns ready made tracks
     @staticmethod
     def make_default_track(choice=1):
@@ -151,10 +236,15 @@ class Track:
 # This acts as the agent.
 class Car:
     max_speed = 3
+    # The shortest tail of an episode whose updates are added all at once, see off_policy_episode()
+    batch_tail = 64
 
     # Constructor
     def __init__(self, track):
-        self.trajectory = []
+        # The trajectory of the current episode is kept in arrays that are reused by every episode, and grown when an
+        # episode does not fit. Its first trajectory_length entries are the state ids, action indices and rewards
+        self.trajectory_length = 0
+        self.allocate_trajectory(256)
         # The speeds and position are randomized through the call to random_start_position()
         self.vertical_speed = 0
         self.horizontal_speed = 0
@@ -162,6 +252,12 @@ class Car:
         self.epsilon = 0.5
 
         self.track = track if isinstance(track, Track) else Track.make_default_track(1)
+        self.action_values = ActionValueStore(self.track)
+
+        # Flat views of the tables of the track, indexed by state id * number of actions + action index. Reading
+        # single items through them is much faster than indexing the arrays
+        self.next_states, self.rewards, self.terminal = (memoryview(table.reshape(-1)) for table in (
+            self.track.next_state, self.track.rewards, self.track.terminal))
         self.random_start_position()
 
     # Returns a string representation of the car
@@ -169,53 +265,149 @@ class Car:
         return "Position = {}, Horizontal speed = {}, Vertical speed = {}".format(self.position, self.horizontal_speed,
                                                                                   self.vertical_speed)
 
+    # Makes room for a trajectory of size steps, keeping the steps already in it
+    def allocate_trajectory(self, size):
+        old = self.trajectory_length
+        arrays = []
+        for name, dtype in (("trajectory_sids", np.int32), ("trajectory_actions", np.int8),
+                            ("trajectory_rewards", np.int32)):
+            array = np.zeros(size, dtype=dtype)
+            if old > 0:
+                array[:old] = getattr(self, name)[:old]
+            setattr(self, name, array)
+            arrays += [array]
+        # Writing single items through a memoryview is much faster than indexing the arrays
+        self.trajectory_views = tuple(memoryview(array) for array in arrays)
+
+    # The (state id, action index, reward) tuples of the current trajectory
+    @property
+    def trajectory(self):
+        n = self.trajectory_length
+        return list(zip(self.trajectory_sids[:n].tolist(), self.trajectory_actions[:n].tolist(),
+                        self.trajectory_rewards[:n].tolist()))
+
     # Generates an episode by moving the car from the start to the finish, choosing different actions on each step
+    # The rewards and moves are looked up in the tables compiled by the track, and the steps are written to the
+    # trajectory arrays. Returns the index of the first step that did not take the greedy action, or None
     def generate_episode(self):
         first_non_greedy_action = None
-        while not self.check_finish(self.position):
-            state = State.get_state((self.position[0], self.position[1], self.horizontal_speed, self.vertical_speed))
-            action, greedy = self.epsilon_greedy_action(state)
+        track = self.track
+        sids, actions, rewards = self.trajectory_views
+        next_states, step_rewards, terminal = self.next_states, self.rewards, self.terminal
+        n_actions = len(ActionValueStore.actions)
+        n = 0
+        sid = track.state_id(self.position, self.horizontal_speed, self.vertical_speed)
+        finished = track.finish_states[sid]
+        while not finished:
+            a, greedy = self.epsilon_greedy_action(sid)
 
             # Keeping track of the first time we did not take the optimal action
             if not greedy and first_non_greedy_action is None:
-                first_non_greedy_action = len(self.trajectory)
-
-            reward = self.check_reward(state, action)
-            self.trajectory += [(state, action, reward)]
-            self.apply_action(action)
-            self.move()
+                first_non_greedy_action = n
+
+            if n == len(sids):
+                self.trajectory_length = n
+                self.allocate_trajectory(2 * n)
+                sids, actions, rewards = self.trajectory_views
+            i = sid * n_actions + a
+            sids[n], actions[n], rewards[n] = sid, a, step_rewards[i]
+            n += 1
+            finished = terminal[i]
+            sid = next_states[i]
+
+        self.trajectory_length = n
+
+        xpos, ypos, self.horizontal_speed, self.vertical_speed = track.state_tuples[sid]
+        self.position = [xpos, ypos]
         return first_non_greedy_action
 
     # Applies the Off-Policy Monte Carlo learning method to the model
     def off_policy_monte_carlo(self, iterations):
         for _ in range(-1, iterations):
-            self.reset()
-            nongreedy_action_index = self.generate_episode()
-
-            # If nongreedy_action_index is None, all the actions taken were greedy and optimal. Skip this trajectory
-            if nongreedy_action_index is None:
-                continue
-
-            # Remove the trajectory entries where an optimal action is taken
-            # See page 123 in the book http://people.inf.elte.hu/lorincz/Files/RL_2006/SuttonBook.pdf
-            self.trajectory = self.trajectory[nongreedy_action_index:]
-
-            # The current state's returns is this state's reward
-            # plus the discounted reward of the next state. The next states reward is its rewards plus the
-            # discounted reward of its next state. This is why we reverse the trajectory. The algorithm in the
-            # book also states that the weight of this state is the product of all the weights from this state until
-            # the final state in the trajectory. This is also taken into account by reversing the trajectory
-            self.trajectory = self.trajectory[::-1]
-            W, G = 1., 0
-
-            for step in self.trajectory:
-                action_info = step[0].get_action_value(step[1])
-                weight_denominator = self.epsilon / len(step[0].action_dictionary)
-                W = W * (1 / weight_denominator) if step[1] == step[0].get_best_action() else (1 / (1 - self.epsilon + weight_denominator))
-                G = 0.90 * G + step[2]
-                N = action_info[1] + (W * G)
-                D = action_info[2] + W
-                step[0].set_action_value(step[1], (N / D, N, D))
+            self.off_policy_episode()
+
+    # Generates one episode and learns from it with the Off-Policy Monte Carlo method
+    def off_policy_episode(self):
+        self.reset()
+        nongreedy_action_index = self.generate_episode()
+
+        # If nongreedy_action_index is None, all the actions taken were greedy and optimal. Skip this trajectory
+        if nongreedy_action_index is None:
+            return
+
+        # Only the trajectory entries from the first non greedy action on are learned from, as views of the arrays
+        # See page 123 in the book http://people.inf.elte.hu/lorincz/Files/RL_2006/SuttonBook.pdf
+        end = self.trajectory_length
+        sids = self.trajectory_sids[nongreedy_action_index:end]
+        actions = self.trajectory_actions[nongreedy_action_index:end]
+        values = self.action_values
+
+        # The current state's returns is this state's reward plus the discounted reward of the next state, and the
+        # weight of this state is the product of all the weights from this state until the final state in the
+        # trajectory, so both are computed walking backwards from the end. An action that is the best one multiplies
+        # the weight, any other one starts it over. Most tails are a few steps long, and those are learned from one
+        # step at a time. The best actions only change for the states that are updated, so on a long tail where no
+        # state is visited twice they can all be looked up before any update, and the updates added all at once
+        if end - nongreedy_action_index < Car.batch_tail or (
+                not values.frozen and len(np.unique(sids)) < len(sids)):
+            self.learn_backwards(nongreedy_action_index)
+            return
+
+        W, G = np.empty(len(sids)), np.empty(len(sids))
+        w, g = 1., 0
+        all_sids, all_actions, rewards = self.trajectory_views
+        best_actions, valid_lists = values.best_actions, values.valid_lists
+        for k in range(end - 1, nongreedy_action_index - 1, -1):
+            sid, a = all_sids[k], all_actions[k]
+            weight_denominator = self.epsilon / len(valid_lists[sid])
+            if a == best_actions[sid]:
+                w = w * (1 / weight_denominator)
+            else:
+                w = 1 / (1 - self.epsilon + weight_denominator)
+            g = 0.90 * g + rewards[k]
+            W[k - nongreedy_action_index], G[k - nongreedy_action_index] = w, g
+        values.add_weighted_returns(sids, actions, W * G, W)
+
+    # Learns from the steps of the trajectory from start on one at a time, going backwards from the last one
+    def learn_backwards(self, start):
+        sids, actions, rewards = self.trajectory_views
+        values = self.action_values
+        best_actions, valid_lists = values.best_actions, values.valid_lists
+        add_weighted_return = values.add_weighted_return
+        W, G = 1., 0
+        for k in range(self.trajectory_length - 1, start - 1, -1):
+            sid, a = sids[k], actions[k]
+            weight_denominator = self.epsilon / len(valid_lists[sid])
+            if a == best_actions[sid]:
+                W = W * (1 / weight_denominator)
+            else:
+                W = 1 / (1 - self.epsilon + weight_denominator)
+            G = 0.90 * G + rewards[k]
+            add_weighted_return(sid, a, W * G, W)
+
+    # Applies the Off-Policy Monte Carlo learning method using several processes. The N and D sums are additive
+    # across episodes, so every worker runs sync_every episodes against a frozen copy of the greedy policy and sends
+    # back what it added to N and D. These are summed into this car's action values, and the greedy policy is
+    # updated, before the next batch starts. workers defaults to the number of CPUs
+    def parallel_off_policy_monte_carlo(self, iterations, workers=None, sync_every=1000, seed=None):
+        workers = workers or multiprocessing.cpu_count()
+        seeds = random.Random(seed)
+        values = self.action_values
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self.track, self.epsilon)) as pool:
+            remaining = iterations
+            while remaining > 0:
+                batches = []
+                while remaining > 0 and len(batches) < workers:
+                    batches += [min(sync_every, remaining)]
+                    remaining -= batches[-1]
+
+                policy = np.array(values.best_actions, dtype=np.int8)
+                tasks = [(policy, episodes, seeds.getrandbits(64)) for episodes in batches]
+                updated = []
+                for indices, N, D in pool.starmap(_run_off_policy_batch, tasks):
+                    values.merge(indices, N, D)
+                    updated += [indices // values.D.shape[1]]
+                values.update_best_actions(np.unique(np.concatenate(updated)))
 
     # Applies an action to the speeds of the car
     def apply_action(self, a):
@@ -224,7 +416,7 @@ class Car:
 
     # Returns a random starting position from the starting positions of the track
     def random_start_position(self):
-        self.trajectory = []
+        self.trajectory_length = 0
         self.vertical_speed = random.randrange(0, Car.max_speed + 1)
         self.horizontal_speed = random.randrange(0, Car.max_speed + 1)
         if self.vertical_speed == 0 and self.horizontal_speed == 0:
@@ -237,59 +429,24 @@ class Car:
         self.position = start[random.randrange(0, len(start), 1)]
 
     # Moves the car by updating its position. If the car drives off the edge, or does not move at all,
-    # the position is clipped(preventing the car from going off the edge) using the method move_slowly()
-    # or moved once up or to the right if it remained stationary
+    # the position is clipped(preventing the car from going off the edge), see Track.drive()
     def move(self):
-        new_pos = [self.position[0] + self.horizontal_speed, self.position[1] + self.vertical_speed]
+        self.position = self.track.drive(self.position, self.horizontal_speed, self.vertical_speed)
 
-        if self.track.valid_cell(new_pos):
-            self.position = new_pos
-        else:
-            temp = [self.position[0], self.position[1]]
-            self.move_slowly()
-            # Checking if the agent moved. We do this because the agent must move after each step
-            if temp == self.position:
-                coords = [self.position[0] + 1, self.position[1]]
-                coords2 = [self.position[0], self.position[1] + 1]
-                # If the agent did not move, then either up or right are invalid. We take a step in the valid direction
-                if self.track.valid_cell(coords):
-                    self.position = coords
-                elif self.track.valid_cell(coords2):
-                    self.position = coords2
-
-    # Moves the agent in an alternating fashion of up and right one step at a time(This is the clipping of the move)
-    def move_slowly(self, remaining_x_moves=None, remaining_y_moves=None, moved=True, going_up=True):
-        remaining_x_moves = self.horizontal_speed if remaining_x_moves is None else remaining_x_moves
-        remaining_y_moves = self.vertical_speed if remaining_y_moves is None else remaining_y_moves
-
-        remaining = remaining_y_moves if going_up else remaining_x_moves
-        valid = False
-        if remaining > 0:
-            coords = [self.position[0] + (0 if going_up else 1),
-                      self.position[1] + (1 if going_up else 0)]
-            valid = self.track.valid_cell(coords)
-        if valid:
-            self.position = coords
-            remaining_x_moves -= 0 if going_up else 1
-            remaining_y_moves -= 1 if going_up else 0
-        if valid or moved:
-            self.move_slowly(remaining_x_moves, remaining_y_moves, valid, not going_up)
-
-    # Chooses an action using the epsilon-greedy soft policy
+    # Chooses an action index in the state with id sid using the epsilon-greedy soft policy
     # Returns a tuple. First, the appropriate action. Second, returns True if the action chosen
     # is the best action, False otherwise
-    def epsilon_greedy_action(self, state):
+    def epsilon_greedy_action(self, sid):
         if random.random() >= self.epsilon:
-            return state.get_best_action(), True
+            return self.action_values.get_best_action(sid), True
         else:
-            a = state.get_random_action()
-            return a, (a == state.get_best_action())
+            a = self.action_values.get_random_action(sid)
+            return a, (a == self.action_values.get_best_action(sid))
 
-    # Checks the reward of the next step, taking an action, a, into account. Reward of -1 if the car stays on
+    # Checks the reward of the next step, taking the action index a into account. Reward of -1 if the car stays on
     # the track, -5 otherwise
-    def check_reward(self, state, a):
-        coords = (state.xpos + state.xspeed + a[0], state.ypos + state.yspeed + a[1])
-        return -1 if self.track.valid_cell(coords) else -5
+    def check_reward(self, sid, a):
+        return int(self.track.rewards[sid, a])
 
     # Checks if a cell is on a Finish cell. The pos is of the form [x, y]
     def check_finish(self, pos):
@@ -304,7 +461,9 @@ class Car:
             self.reset()
             self.position = coords
             self.generate_episode()
-            trajectories += "\n{}\n".format(self.trajectory)
+            trajectory = [(self.track.state_tuples[sid], ActionValueStore.actions[a], reward)
+                          for sid, a, reward in self.trajectory]
+            trajectories += "\n{}\n".format(trajectory)
         self.epsilon = temp_epsilon
         return trajectories
 
@@ -313,70 +472,149 @@ class Car:
         self.random_start_position()
 
 
-# This class stores all the states and all the possible actions from that state with their associated action values
-class State:
-    actions = [(1, 1), (-1, 0), (-1, 1), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0), (-1, -1)]
+# The car of a worker process of Car.parallel_off_policy_monte_carlo()
+_worker_car = None
 
-    # The states are stored with keys being of the form (xpos, ypos, xspeed, yspeed)
-    states_dictionary = {}
-
-    def __init__(self, xpos, ypos, xspeed, yspeed):
-        self.xpos = xpos
-        self.ypos = ypos
-        self.xspeed = xspeed
-        self.yspeed = yspeed
-        self.action_dictionary = {}
-
-        for pair in State.actions:
-            # First, check if the conditions on the vertical and horizontal speeds are satisfied,
-            # then add the action to the dictionary
-            if 0 <= self.xspeed + pair[0] <= Car.max_speed and 0 <= self.yspeed + pair[1] <= Car.max_speed \
-                    and (self.xspeed + pair[0] != 0 or self.yspeed + pair[1] != 0):
-                # Every action in this state has 3 values associated with it, (Q(s, a), N(s, a), D(s, a)),
-                # where Q is the action value, N is the numerator, and D the denominator
-                # See page 123 in the book http://people.inf.elte.hu/lorincz/Files/RL_2006/SuttonBook.pdf
-                # The Q(s, a) values start at a negative number and not 0 because I wanted to give it
-                # a pessimistic value. This is to prevent an action value from not being updated because
-                # it is the optimal move with value 0, when that is actually the default
-                # random value. So I use a negative number instead
-                self.action_dictionary[pair] = (float("-inf"), 0., 0.)
-
-    # Returns a string representation of the state
-    def __str__(self):
-        return "xpos = {}, ypos = {}, xspeed = {}, yspeed = {}\nAction Dictionary:\n{}\n" \
-            .format(self.xpos, self.ypos, self.xspeed, self.yspeed, self.action_dictionary.items())
 
-    # Returns a string og the state as a tuple
-    def __repr__(self):
-        return "({}, {}, {}, {})".format(self.xpos, self.ypos, self.xspeed, self.yspeed)
-        #return self.__str__()
+# Sets up a worker process of Car.parallel_off_policy_monte_carlo()
+def _init_worker(track, epsilon):
+    global _worker_car
+    _worker_car = Car(track)
+    _worker_car.epsilon = epsilon
+    _worker_car.action_values.frozen = True
 
-    # Returns the action with the highest Q(s, a)
-    def get_best_action(self):
-        return max(self.action_dictionary, key=self.action_dictionary.get)
 
-    # Returns a random valid action
-    def get_random_action(self):
-        return random.choice(list(self.action_dictionary.keys()))
+# Runs a batch of episodes in a worker process, following the greedy policy given as an array of action indices.
+# Returns the flat indices of the state-action pairs that were updated, and what was added to their N and D
+def _run_off_policy_batch(policy, episodes, seed):
+    random.seed(seed)
+    values = _worker_car.action_values
+    values.best_actions = policy.tolist()
+    values.N[:] = 0.
+    values.D[:] = 0.
+    for _ in range(episodes):
+        _worker_car.off_policy_episode()
 
-    # Gets a state from the states_dictionary, makes a new State object if the desired state is not present
-    # The state tuple is of the form (xpos, ypos, xspeed, yspeed)
-    @staticmethod
-    def get_state(state_tuple):
-        # Make sure that a State is always returned
-        if State.states_dictionary.get(state_tuple) is None:
-            State.states_dictionary[state_tuple] = State(state_tuple[0], state_tuple[1], state_tuple[2], state_tuple[3])
+    indices = np.flatnonzero(values.D)
+    return indices, values.N.flat[indices], values.D.flat[indices]
 
-        return State.states_dictionary.get(state_tuple)
 
-    # Returns the action value of a certain action in this state
-    def get_action_value(self, a):
-        return self.action_dictionary[a]
-
-    # Sets the action value of certain action in this state
-    def set_action_value(self, a, val):
-        self.action_dictionary[a] = val
+# This class stores the action values of all the states of a track in arrays indexed by [state id, action index],
+# using the state ids compiled by the track
+class ActionValueStore:
+    actions = [(1, 1), (-1, 0), (-1, 1), (0, -1), (0, 0), (0, 1), (1, -1), (1, 0), (-1, -1)]
 
-    # Returns the state in tuple form
-    def tuple_form(self):
-        return self.xpos, self.ypos, self.xspeed, self.yspeed
+    # Every action has 3 values associated with it, (Q(s, a), N(s, a), D(s, a)), where Q is the action value, N is the
+    # numerator, and D the denominator. See page 123 in the book
+    # http://people.inf.elte.hu/lorincz/Files/RL_2006/SuttonBook.pdf
+    # The Q(s, a) values start at a negative number and not 0 because I wanted to give it a pessimistic value. This is
+    # to prevent an action value from not being updated because it is the optimal move with value 0, when that is
+    # actually the default random value. So I use a negative number instead
+    def __init__(self, track):
+        n_states, n_actions = track.valid_actions.shape
+        self.Q = np.full((n_states, n_actions), float("-inf"))
+        self.N = np.zeros((n_states, n_actions))
+        self.D = np.zeros((n_states, n_actions))
+        self.valid_actions = track.valid_actions
+        self.n_actions = n_actions
+        # Flat views of Q, N and D, indexed by state id * n_actions + action index, for fast single reads and writes
+        self.q, self.n, self.d = (memoryview(values.reshape(-1)) for values in (self.Q, self.N, self.D))
+
+        # The valid action indices of each state, packed at the start of their row, and how many there are
+        self.valid_count = self.valid_actions.sum(axis=1)
+        self.valid_order = np.argsort(~self.valid_actions, axis=1, kind="stable").astype(np.int8)
+        self.valid_lists = [order[:count] for order, count in zip(self.valid_order.tolist(), self.valid_count.tolist())]
+
+        # The best action of every state, kept up to date by update_best_action(). With no updates yet, every valid
+        # action ties at -inf, so the first valid action is the best one
+        self.best_actions = self.valid_order[:, 0].tolist()
+
+        # When frozen, the weighted returns are only summed into N and D. Q and the best actions are left as they are,
+        # so the policy being learned stays fixed
+        self.frozen = False
+
+        # The states whose values changed since the last checkpoint, see TrackCheckpoint
+        self.touched = np.zeros(n_states, dtype=bool)
+        self.touched_flags = memoryview(self.touched)
+
+    # Returns the action index with the highest Q(s, a)
+    def get_best_action(self, sid):
+        return self.best_actions[sid]
+
+    # Returns a random valid action index
+    def get_random_action(self, sid):
+        valid = self.valid_lists[sid]
+        return valid[random.randrange(len(valid))]
+
+    # Returns the (Q, N, D) values of an action as a tuple
+    def get_action_value(self, sid, a):
+        i = sid * self.n_actions + a
+        return self.q[i], self.n[i], self.d[i]
+
+    # Adds a weighted return to the numerator and a weight to the denominator of Q(s, a)
+    # Only the updated action can take over as the best action, unless the best action itself got worse, in which
+    # case the whole row has to be searched again
+    def add_weighted_return(self, sid, a, weighted_return, weight):
+        self.touched_flags[sid] = True
+        i = sid * self.n_actions + a
+        if self.frozen:
+            self.n[i] += weighted_return
+            self.d[i] += weight
+            return
+
+        old = (self.q[i], self.n[i], self.d[i])
+        N = old[1] + weighted_return
+        D = old[2] + weight
+        new = (N / D, N, D)
+        self.q[i], self.n[i], self.d[i] = new
+
+        b = self.best_actions[sid]
+        if a != b:
+            best = self.get_action_value(sid, b)
+            if new > best or (new == best and a < b):
+                self.best_actions[sid] = a
+        elif new < old:
+            self.update_best_action(sid)
+
+    # Adds the weighted returns and weights of many actions at once, sids and actions being arrays of state ids and
+    # action indices, where a (state, action) pair can appear more than once. The best actions of the updated states
+    # are searched again once everything is added
+    def add_weighted_returns(self, sids, actions, weighted_returns, weights):
+        np.add.at(self.N, (sids, actions), weighted_returns)
+        np.add.at(self.D, (sids, actions), weights)
+        self.touched[sids] = True
+        if self.frozen:
+            return
+        self.Q[sids, actions] = self.N[sids, actions] / self.D[sids, actions]
+        self.update_best_actions(np.unique(sids))
+
+    # Recomputes the best action of one state. A row only has 9 actions, so a plain loop over them is faster than
+    # going through numpy. max() keeps the first of equal keys, so ties go to the first action like
+    # update_best_actions()
+    def update_best_action(self, sid):
+        q, n, d = self.Q[sid].tolist(), self.N[sid].tolist(), self.D[sid].tolist()
+        self.best_actions[sid] = max(self.valid_lists[sid], key=lambda a: (q[a], n[a], d[a]))
+
+    # Recomputes the best action of the states with ids sids with a masked argmax. Ties are broken the same way as
+    # comparing (Q, N, D) tuples would: by the highest N, then the highest D, then the first action
+    def update_best_actions(self, sids):
+        valid = self.valid_actions[sids]
+        ties = valid & (self.Q[sids] == self.Q[sids].max(axis=1, where=valid, initial=float("-inf"))[:, None])
+        for values in (self.N[sids], self.D[sids]):
+            values = np.where(ties, values, float("-inf"))
+            ties &= values == values.max(axis=1)[:, None]
+        for sid, a in zip(sids, ties.argmax(axis=1).tolist()):
+            self.best_actions[sid] = a
+
+    # Adds sums of weighted returns and weights, collected elsewhere, to N and D. The indices are flat indices into
+    # the [state id, action index] arrays
+    def merge(self, indices, N, D):
+        self.N.flat[indices] += N
+        self.D.flat[indices] += D
+        self.Q.flat[indices] = self.N.flat[indices] / self.D.flat[indices]
+        self.touched[indices // self.D.shape[1]] = True
+
+    # Checks if the speeds are within the speed limit, and that the car is not standing still
+    @staticmethod
+    def is_valid_speed(xspeed, yspeed):
+        return 0 <= xspeed <= Car.max_speed and 0 <= yspeed <= Car.max_speed and (xspeed != 0 or yspeed != 0)